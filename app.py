@@ -1,36 +1,212 @@
-from flask import Flask, request
-from context import ConversationContext  # Assegure-se de que esta importação está correta
-from states import ChatBot, StartState  # Assegure-se de que StartState está sendo importado corretamente
-from database import db
+from flask import Blueprint, Flask, Response, request, jsonify
+from states import ChatBot
+from database import dispose_engines, init_app as init_db, pool_stats
+import atexit
+import logging
+import os
+import sys
+import threading
 import twilio_helpers
+from worker_pool import KeyedWorkerPool, QueueFullError
+from dedup import create_dedup_store
+from inbound_limits import create_inbound_limiter
+from tenants import registry as tenants, use_tenant
+from contract_cache import prewarm_contracts
+from ticket_cache import ticket_cache
+from transcript import transcripts
+import artifacts
+from instrumentation import INBOUND_LIMITED, GaugeCollector, log_event, maybe_profile, render_metrics, setup_logging
 
-app = Flask(__name__)
-app.config.from_object('database.Config')
-db.init_app(app)
+bp = Blueprint('chatbot', __name__)
 
 bot = ChatBot()
+seen_messages = create_dedup_store()  # Evita reprocessar entregas repetidas da Twilio
+inbound_limiter = create_inbound_limiter()  # Protege o banco e a fila de envio contra flood
 
-@app.route('/sms', methods=['POST'])
-def sms_reply():
-    phone_number = request.form['From']
-    incoming_msg = request.form['Body']
-    my_twilio_number = request.form['To']
+_app = None
+_app_lock = threading.Lock()
+
+def create_app():
+    # Fábrica do app do webhook: gunicorn 'app:create_app()' (ou app:app, criado sob demanda).
+    # Nada aqui abre threads ou conexões que precisem sobreviver ao fork do gunicorn --preload.
+    setup_logging()
+    flask_app = Flask(__name__)
+    init_db(flask_app)
+    flask_app.register_blueprint(bp)
+    if os.getenv('CONTRACT_CACHE_PREWARM') == '1':
+        with flask_app.app_context():
+            log_event('contracts_prewarmed', count=prewarm_contracts())
+            dispose_engines()
+    global _app
+    if _app is None:
+        _app = flask_app  # Usado pelas threads do modo assíncrono e pelo /metrics
+    return flask_app
 
-    if phone_number not in bot.conversation_state:
-        bot.conversation_state[phone_number] = ConversationContext(StartState, phone_number, my_twilio_number)
+def get_app():
+    with _app_lock:
+        if _app is None:
+            create_app()
+        return _app
 
-    response = bot.conversation_state[phone_number].request(incoming_msg)
-    print(f"Response to send: {response}")  # Log da resposta antes de enviar
+def __getattr__(name):
+    # Mantém `from app import app` e `gunicorn app:app` funcionando sem criar o app na importação
+    if name == 'app':
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
+def process_turn(phone_number, incoming_msg, my_twilio_number, message_sid=None):
+    # O número que recebeu a mensagem decide o tenant: banco, caches e conta Twilio
+    with use_tenant(tenants.for_number(my_twilio_number)):
+        response = bot.handle_message(phone_number, incoming_msg, my_twilio_number)
     if isinstance(response, list) and response:
-        twilio_helpers.send_auto_messages(phone_number, response, my_twilio_number)
-        return ('', 204)
+        try:
+            twilio_helpers.send_auto_messages(phone_number, response, my_twilio_number)
+        except QueueFullError:
+            # O estado da conversa já foi salvo: devolver erro faria a Twilio repetir a mesma mensagem sobre o
+            # estado novo (ex.: '2' do menu virando número de chamado). A resposta perdida fica no log.
+            log_event('reply_dropped', logging.ERROR, phone_number=phone_number, message_sid=message_sid,
+                      messages=len(response), response=repr(response)[:500])
     else:
-        print("No valid message to send, received:", response)
-        return ('', 204)
+        log_event('empty_response', logging.WARNING, phone_number=phone_number, response=repr(response))
+
+def run_turn_in_background(phone_number, turn):
+    # Os workers rodam fora da requisição, então precisam do próprio app context para o banco
+    with get_app().app_context(), maybe_profile():
+        process_turn(*turn)
+
+# Modo assíncrono (ASYNC_WEBHOOK=1): o webhook só enfileira e a conversa roda num pool de workers,
+# serializado por telefone para que duas mensagens seguidas do mesmo usuário nunca disputem o contexto
+ASYNC_WEBHOOK = os.getenv('ASYNC_WEBHOOK') == '1'
+PROFILE_ALLOW_HEADER = os.getenv('PROFILE_ALLOW_HEADER') == '1'
+_turn_pipeline = None
+_turn_pipeline_lock = threading.Lock()
+
+def get_turn_pipeline():
+    # Criado sob demanda para que os workers não sejam iniciados antes do fork do gunicorn
+    global _turn_pipeline
+    with _turn_pipeline_lock:
+        if _turn_pipeline is None:
+            _turn_pipeline = KeyedWorkerPool(
+                run_turn_in_background,
+                workers=int(os.getenv('TURN_WORKERS', '8')),
+                max_queue_size=int(os.getenv('TURN_MAX_QUEUE', '10000')),
+                name='turn-pipeline',
+            )
+            _turn_pipeline.start()
+            atexit.register(_turn_pipeline.shutdown, float(os.getenv('TURN_DRAIN_TIMEOUT', '30')))
+        return _turn_pipeline
+
+@bp.route('/sms', methods=['POST'])
+def sms_reply():
+    phone_number = request.form.get('From')
+    incoming_msg = request.form.get('Body')
+    my_twilio_number = request.form.get('To')
+    message_sid = request.form.get('MessageSid')
+    if not phone_number or incoming_msg is None or not my_twilio_number:
+        return ('', 400)
+
+    tenant = tenants.for_number(my_twilio_number)
+    if tenant is None:
+        # TENANTS_STRICT=1 e o número não pertence a nenhum tenant
+        log_event('unknown_number', logging.WARNING, my_twilio_number=my_twilio_number)
+        return ('', 404)
+
+    # Antes do dedup e da conversa: uma mensagem recusada aqui não toca no banco nem na fila de envio
+    limited = inbound_limiter.check(phone_number, my_twilio_number, tenant)
+    if limited:
+        limit, retry_after = limited
+        INBOUND_LIMITED.inc(limit)
+        log_event('rate_limited', logging.WARNING, phone_number=phone_number, limit=limit)
+        return ('', 429, {'Retry-After': str(max(1, round(retry_after)))})
+
+    if message_sid:
+        is_new, status = seen_messages.claim(message_sid)
+        if not is_new:
+            # Repetição da Twilio: responde com o resultado anterior sem rodar a conversa de novo
+            log_event('duplicate_delivery', message_sid=message_sid, phone_number=phone_number)
+            return ('', status or 204)
+
+    try:
+        if ASYNC_WEBHOOK:
+            get_turn_pipeline().submit(phone_number, [(phone_number, incoming_msg, my_twilio_number, message_sid)])
+        else:
+            # X-Profile: 1 liga o profiler só para esta requisição (se PROFILE_ALLOW_HEADER=1)
+            force_profile = PROFILE_ALLOW_HEADER and request.headers.get('X-Profile') == '1'
+            with maybe_profile(force_profile):
+                process_turn(phone_number, incoming_msg, my_twilio_number, message_sid)
+    except QueueFullError as e:
+        # Só a fila de turnos (ASYNC_WEBHOOK) chega aqui: a conversa ainda não rodou e a Twilio pode repetir
+        log_event('message_rejected', logging.WARNING, phone_number=phone_number, error=str(e))
+        if message_sid:
+            seen_messages.release(message_sid)
+        return ('', 503)
+    except Exception:
+        if message_sid:
+            seen_messages.release(message_sid)
+        raise
+    if message_sid:
+        seen_messages.complete(message_sid, 204)
+    return ('', 204)
+
+# Valores lidos no momento da coleta do /metrics
+GaugeCollector('chatbot_active_sessions', 'Conversas ativas no session store', lambda: len(bot.conversation_state))
+GaugeCollector('chatbot_dispatcher_queue_depth', 'Mensagens aguardando envio',
+               lambda: twilio_helpers.get_dispatcher().metrics()['queue_depth'])
+GaugeCollector('chatbot_dispatcher_messages', 'Mensagens por resultado desde o início do processo',
+               lambda: {k: v for k, v in twilio_helpers.get_dispatcher().metrics().items()
+                        if k in ('sent', 'failed', 'retried')}, labelname='result')
+GaugeCollector('chatbot_db_pool_checked_out', 'Conexões em uso por pool',
+               lambda: {name: p['checked_out'] for name, p in _pool_stats().items()}, labelname='pool')
+GaugeCollector('chatbot_db_pool_utilization', 'Fração do pool em uso',
+               lambda: {name: p['utilization'] for name, p in _pool_stats().items()}, labelname='pool')
+GaugeCollector('chatbot_db_pool_checkout_wait_p95_seconds', 'Espera p95 por uma conexão',
+               lambda: {name: p['checkout_wait_p95'] for name, p in _pool_stats().items()}, labelname='pool')
+GaugeCollector('chatbot_report_jobs_in_flight', 'Relatórios na fila ou em geração',
+               lambda: _report_jobs_in_flight())
+GaugeCollector('chatbot_ticket_cache', 'Cache de atualizações de chamados: tamanho e contadores de acesso',
+               lambda: _sum_stats(cache.stats() for cache in ticket_cache.instances()), labelname='metric')
+GaugeCollector('chatbot_transcript', 'Registro de conversas: pendentes, gravados, descartados e falhas',
+               lambda: transcripts.stats() if transcripts else {}, labelname='metric')
+GaugeCollector('chatbot_tenants_loaded', 'Tenants com banco e caches carregados neste processo',
+               lambda: len(tenants.loaded()))
+GaugeCollector('chatbot_inbound_limiter_keys', 'Baldes de limite de entrada ativos', lambda: len(inbound_limiter.backend))
+GaugeCollector('chatbot_turn_pipeline_queue_depth', 'Turnos aguardando processamento (modo assíncrono)',
+               lambda: get_turn_pipeline().stats()['queue_depth'] if ASYNC_WEBHOOK else 0)
+
+def _report_jobs_in_flight():
+    # O módulo de relatórios só é carregado no primeiro pedido; antes disso não há jobs
+    reports = sys.modules.get('reports')
+    return reports.get_report_jobs().stats()['in_flight'] if reports else 0
+
+def _sum_stats(stats):
+    # Soma os contadores das instâncias de cada tenant
+    total = {}
+    for item in stats:
+        for key, value in item.items():
+            total[key] = total.get(key, 0) + value
+    return total
+
+def _pool_stats():
+    with get_app().app_context():
+        return pool_stats(tenants.engines())
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/reports/<job_id>', methods=['GET'])
+def report_status(job_id):
+    from reports import get_report_jobs
+    status = get_report_jobs().status(job_id)
+    if status is None:
+        return jsonify({'error': 'job não encontrado'}), 404
+    if status['result']:
+        status['result'] = artifacts.signed_url(status['result'])
+    return jsonify(status)
+
+@bp.route('/reports/files/<name>', methods=['GET'])
+def download_file(name):
+    return artifacts.send_artifact(name, request.args.get('expires'), request.args.get('signature'))
 
-@app.route('/tmp/<path:filename>', methods=['GET'])
-def download_file(filename):
-    return send_file(f'/tmp/{filename}', as_attachment=True)
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -2,6 +2,7 @@ from flask import Flask, request
 from context import ConversationContext  # Assegure-se de que esta importação está correta
 from states import ChatBot, StartState  # Assegure-se de que StartState está sendo importado corretamente
 from database import db
+import artifacts
 import twilio_helpers
 
 app = Flask(__name__)
@@ -29,5 +30,9 @@ def sms_reply():
         print("No valid message to send, received:", response)
         return ('', 204)
 
+@app.route('/reports/files/<name>', methods=['GET'])
+def download_file(name):
+    return artifacts.send_artifact(name, request.args.get('expires'), request.args.get('signature'))
+
 if __name__ == '__main__':
     app.run(debug=True)
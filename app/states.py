@@ -1,10 +1,12 @@
 from abc import ABC, abstractmethod
-from database import db
+from database import db, app as database_app
 from models import Contrato, Chamado
 from context import ConversationContext
 from twilio_helpers import send_auto_messages
-import pandas as pd
-import pdfkit
+from report_jobs import ReportJobManager, JobQueueFullError
+import artifacts
+import os
+import uuid
 class ChatBot:
     def __init__(self):
         # Guarda as conversas que o robô está tendo, cada uma com seu próprio telefone
@@ -138,47 +140,53 @@ class GenerateReportState(State):
         return response_messages
     
     def auto_respond(self):
-        chamados = self.get_calls(self.context.contract_id)
-        if not chamados:
-            return ["Não há chamados registrados para este contrato."]
-        
-        excel_path = self.generate_excel(chamados)
-        pdf_path = self.convert_excel_to_pdf(excel_path)
-        self.send_pdf_via_twilio(pdf_path, self.context.phone_number)
-        
+        phone_number = self.context.phone_number
+        my_twilio_number = self.context.my_twilio_number
+
+        def send_report(job):
+            if job['status'] == 'done' and job['result']:
+                # O PDF fica no artifact store e o usuário recebe um link assinado, servido por /reports/files
+                link = artifacts.signed_url(job['result'])
+                send_auto_messages(phone_number, [f"Relatório gerado com sucesso! Baixe aqui: {link}"], my_twilio_number)
+            elif job['status'] == 'done':
+                send_auto_messages(phone_number, ["Não há chamados registrados para este contrato."], my_twilio_number)
+            else:
+                send_auto_messages(phone_number, ["Não foi possível gerar o relatório."], my_twilio_number)
+
+        # O PDF é gerado num processo separado; o usuário recebe o arquivo quando o job terminar
+        try:
+            report_jobs.submit(('pdfkit', self.context.contract_id), build_pdfkit_report,
+                               (self.context.contract_id,), on_done=send_report)
+        except JobQueueFullError:
+            return ["Muitos relatórios em preparação no momento. Por favor, tente novamente em alguns minutos."]
+
         self.transition_to(SelectOptionState)
-        return ["Relatório gerado e enviado para o seu número. Por favor, escolha uma opção:\n1. Ver chamados\n2. Gerar relatório"]
-    
-    def get_calls(self, contract_id):
-        return Chamado.query.filter_by(contrato_id=contract_id).order_by(Chamado.data_chamado.desc()).all()
-    
-    def generate_excel(self, chamados):
-        data = [(chamado.id, chamado.descricao, chamado.status, chamado.data_criacao) for chamado in chamados]
-        df_chamados = pd.DataFrame(data, columns=['ID', 'Descrição', 'Status', 'Data de Criação'])
-        excel_path = 'chamados.xlsx'
-        df_chamados.to_excel(excel_path, index=False)
-        return excel_path
-    
-    def convert_excel_to_pdf(self, excel_path):
-        pdf_path = 'chamados.pdf'
-        pdfkit.from_file(excel_path, pdf_path)
-        return pdf_path
-    
-    def send_pdf_via_twilio(self, pdf_path, to_phone_number):
-        account_sid = os.getenv('TWILIO_ACCOUNT_SID')
-        auth_token = os.getenv('TWILIO_AUTH_TOKEN')
-        client = Client(account_sid, auth_token)
-        
-        media_url = f'http://your_domain.com/{pdf_path}'
-        
-        message = client.messages.create(
-            body='Aqui está o relatório de chamados em PDF.',
-            from_='+1234567890',  # Seu número Twilio
-            to=to_phone_number,
-            media_url=[media_url]
-        )
-        
-        return message.sid
+        return ["Seu relatório está sendo preparado e será enviado para o seu número. Por favor, escolha uma opção:\n1. Ver chamados\n2. Gerar relatório"]
+
+def build_pdfkit_report(contract_id):
+    # Ponto de entrada no processo do pool: monta uma tabela HTML e converte para PDF com o pdfkit
+    with database_app.app_context():
+        chamados = db.session.query(
+            Chamado.id, Chamado.descricao, Chamado.data_chamado, Chamado.data_atualizacao
+        ).filter_by(contrato_id=contract_id).order_by(Chamado.data_chamado.desc()).all()
+    if not chamados:
+        return None
+    # Dependências pesadas carregadas só no processo que gera o relatório
+    import pandas as pd
+    import pdfkit
+    df_chamados = pd.DataFrame(chamados, columns=['ID', 'Descrição', 'Data de Criação', 'Última Atualização'])
+    # pdfkit.from_string sem caminho devolve os bytes do PDF, gravados de forma atômica no artifact store
+    name = artifacts.artifact_name(f'pdfkit:{contract_id}:{uuid.uuid4().hex}', 'pdf')
+    with artifacts.atomic_write(name) as f:
+        f.write(pdfkit.from_string(df_chamados.to_html(index=False), False))
+    return name
+
+report_jobs = ReportJobManager(
+    max_workers=int(os.getenv('REPORT_WORKERS', '2')),
+    max_pending=int(os.getenv('REPORT_MAX_PENDING', '100')),
+    start_method=os.getenv('REPORT_START_METHOD', 'spawn'),
+)
+
 class EndState(State):
     def handle_request(self, message):
         return ['Atendimento concluído. Obrigado por usar nossos serviços!']
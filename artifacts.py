@@ -0,0 +1,149 @@
+# artifacts.py
+import hashlib
+import hmac
+import os
+import secrets
+import tempfile
+import time
+from contextlib import contextmanager
+from urllib.parse import urlencode
+from flask import abort, make_response, send_from_directory
+
+ARTIFACTS_DIR = os.getenv('ARTIFACTS_DIR', '/tmp/chatbot_reports')
+ARTIFACT_URL_TTL = int(os.getenv('ARTIFACT_URL_TTL', '86400'))  # Validade do link enviado ao usuário
+ARTIFACT_MAX_AGE = int(os.getenv('ARTIFACT_MAX_AGE', str(7 * 86400)))
+ARTIFACT_MAX_BYTES = int(os.getenv('ARTIFACT_MAX_BYTES', str(1024 ** 3)))
+# '' para o Flask servir os bytes, 'nginx' para X-Accel-Redirect ou 'sendfile' para X-Sendfile
+ARTIFACT_SENDFILE = os.getenv('ARTIFACT_SENDFILE', '')
+ARTIFACT_ACCEL_PREFIX = os.getenv('ARTIFACT_ACCEL_PREFIX', '/protected-reports')
+
+_secret = None
+
+
+def _get_secret():
+    # ARTIFACT_SECRET deve ser igual em todos os hosts; sem ele, os workers e os processos
+    # de relatório da mesma máquina compartilham um segredo gerado uma vez no diretório
+    global _secret
+    if _secret is None:
+        secret = os.getenv('ARTIFACT_SECRET')
+        if secret:
+            _secret = secret.encode()
+        else:
+            os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+            path = os.path.join(ARTIFACTS_DIR, '.secret')
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, 'w') as f:
+                    f.write(secrets.token_hex(32))
+            except FileExistsError:
+                pass
+            with open(path) as f:
+                _secret = f.read().strip().encode()
+    return _secret
+
+
+def artifact_name(key, ext):
+    # Nome derivado da chave com HMAC: determinístico para o cache, mas impossível de adivinhar
+    digest = hmac.new(_get_secret(), key.encode(), hashlib.sha256).hexdigest()[:40]
+    return f'{digest}.{ext}'
+
+
+def artifact_path(name):
+    return os.path.join(ARTIFACTS_DIR, name)
+
+
+def exists(name):
+    return os.path.exists(artifact_path(name))
+
+
+@contextmanager
+def atomic_write(name):
+    # Escreve num arquivo temporário no mesmo diretório e renomeia no final, então
+    # gerações concorrentes nunca deixam um arquivo pela metade
+    os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=ARTIFACTS_DIR, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, artifact_path(name))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    evict()
+
+
+def evict(max_age=None, max_bytes=None):
+    # Remove arquivos mais velhos que max_age e depois os mais antigos até caber em max_bytes
+    max_age = ARTIFACT_MAX_AGE if max_age is None else max_age
+    max_bytes = ARTIFACT_MAX_BYTES if max_bytes is None else max_bytes
+    now = time.time()
+    files = []
+    with os.scandir(ARTIFACTS_DIR) as entries:
+        for entry in entries:
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            stat = entry.stat()
+            if entry.name.endswith('.part'):
+                # Arquivos temporários abandonados por um processo que morreu no meio
+                if stat.st_mtime < now - 3600:
+                    _remove(entry.path)
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for mtime, size, path in files:
+        if mtime >= now - max_age and total <= max_bytes:
+            break
+        _remove(path)
+        total -= size
+        removed += 1
+    return removed
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _signature(name, expires):
+    return hmac.new(_get_secret(), f'{name}:{expires}'.encode(), hashlib.sha256).hexdigest()
+
+
+def signed_url(name, expires_in=None):
+    expires = int(time.time()) + (ARTIFACT_URL_TTL if expires_in is None else expires_in)
+    ngrok_url = os.getenv('NGROK_URL')  # Certifique-se de definir isso no seu .env
+    query = urlencode({'expires': expires, 'signature': _signature(name, expires)})
+    return f'{ngrok_url}/reports/files/{name}?{query}'
+
+
+def verify(name, expires, signature):
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(_signature(name, expires), signature or '')
+
+
+def send_artifact(name, expires, signature):
+    # Resposta para a rota de download; send_from_directory cuida de ETag, Last-Modified e Range
+    if not verify(name, expires, signature):
+        abort(403)
+    if not exists(name):
+        abort(404)
+    if ARTIFACT_SENDFILE == 'nginx':
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = f'{ARTIFACT_ACCEL_PREFIX}/{name}'
+        response.headers['Content-Disposition'] = f'attachment; filename={name}'
+        return response
+    if ARTIFACT_SENDFILE == 'sendfile':
+        response = make_response('')
+        response.headers['X-Sendfile'] = artifact_path(name)
+        response.headers['Content-Disposition'] = f'attachment; filename={name}'
+        return response
+    return send_from_directory(ARTIFACTS_DIR, name, as_attachment=True, conditional=True, max_age=ARTIFACT_URL_TTL)
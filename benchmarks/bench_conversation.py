@@ -0,0 +1,206 @@
+# benchmarks/bench_conversation.py
+# Teste de carga da conversa completa: simula vários telefones percorrendo os estados do bot
+# através do /sms e mede latência por turno, vazão, consultas ao banco por turno e pico de memória.
+#
+#   python benchmarks/bench_conversation.py --users 2000 --concurrency 50 --output atual.json
+#   python benchmarks/bench_conversation.py --users 2000 --compare atual.json
+#
+# Sem --url, usa o test client do Flask com um banco SQLite temporário e um cliente Twilio falso.
+# Com --url, envia para um servidor já rodando (o servidor deve usar um Twilio falso ou de teste).
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TWILIO_NUMBER = '+15550000000'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000, help='telefones simulados')
+    parser.add_argument('--concurrency', type=int, default=50, help='conversas em paralelo')
+    parser.add_argument('--contracts', type=int, default=100)
+    parser.add_argument('--tickets-per-contract', type=int, default=50)
+    parser.add_argument('--report-ratio', type=float, default=0.1, help='fração dos usuários que pede relatório')
+    parser.add_argument('--database-url', help='padrão: SQLite temporário')
+    parser.add_argument('--no-seed', action='store_true', help='usa os dados já existentes no banco')
+    parser.add_argument('--url', help='URL base de um servidor rodando, ex.: http://127.0.0.1:5000')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='arquivo JSON com os resultados')
+    parser.add_argument('--compare', help='JSON de uma execução anterior para comparar')
+    return parser.parse_args()
+
+
+class FakeMessages:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        with self._lock:
+            self.count += 1
+
+
+class FakeClient:
+    def __init__(self):
+        self.messages = FakeMessages()
+
+
+def seed_database(db, contracts, tickets_per_contract):
+    # Mesmo gerador e mesmo caminho de upsert do import_data.py
+    from import_data import BulkImporter, chunked, synthetic_rows
+    db.drop_all()
+    db.create_all()
+    BulkImporter().run(chunked(synthetic_rows(contracts, tickets_per_contract), 5000))
+
+
+def conversation(rng, contracts, tickets_per_contract, report_ratio):
+    # Percorre StartState -> SelectOptionState -> GetCallsState -> SelectCallState ->
+    # GetCallUpdatesState -> SelectReturnState e, para parte dos usuários, GenerateReportState
+    contract_id = rng.randint(1, contracts)
+    ticket_id = (contract_id - 1) * tickets_per_contract + rng.randint(1, tickets_per_contract)
+    turns = ['oi', f'CT{contract_id:06d}', '1', str(ticket_id)]
+    if rng.random() < report_ratio:
+        turns += ['1', '2', 'csv']
+    else:
+        turns += ['2']
+    return turns
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    args = parse_args()
+    # Envios e limitadores precisam ser rápidos para medir o bot, não a espera da Twilio
+    os.environ.setdefault('TWILIO_ACCOUNT_SID', 'ACbenchmark')
+    os.environ.setdefault('TWILIO_AUTH_TOKEN', 'benchmark')
+    os.environ.setdefault('TWILIO_MESSAGES_PER_SECOND', '1000000')
+    os.environ.setdefault('TWILIO_MESSAGES_BURST', '1000000')
+    os.environ.setdefault('INBOUND_LIMIT_TO_RATE', '0')  # Todos os usuários simulados falam com o mesmo número
+    os.environ.setdefault('INBOUND_LIMIT_GLOBAL_RATE', '0')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    if not args.url:
+        if not args.database_url:
+            args.database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+        os.environ['DATABASE_URL'] = args.database_url
+
+    query_count = [0]
+    fake_client = FakeClient()
+    if args.url:
+        def post(form):
+            data = urllib.parse.urlencode(form).encode()
+            with urllib.request.urlopen(args.url.rstrip('/') + '/sms', data=data) as response:
+                return response.status
+    else:
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        import twilio_helpers
+        import app as appmod
+        from database import db
+
+        twilio_helpers.client = fake_client
+        if not args.no_seed:
+            with appmod.app.app_context():
+                seed_start = time.perf_counter()
+                seed_database(db, args.contracts, args.tickets_per_contract)
+                print(f"Seeded {args.contracts * args.tickets_per_contract} tickets in "
+                      f"{time.perf_counter() - seed_start:.1f}s", file=sys.stderr)
+
+        @event.listens_for(Engine, 'before_cursor_execute')
+        def count_query(*_):
+            query_count[0] += 1
+
+        local = threading.local()
+
+        def post(form):
+            if not hasattr(local, 'client'):
+                local.client = appmod.app.test_client()
+            return local.client.post('/sms', data=form).status_code
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    rng = random.Random(args.seed)
+    flows = [conversation(rng, args.contracts, args.tickets_per_contract, args.report_ratio)
+             for _ in range(args.users)]
+
+    def run_user(i):
+        phone = f'+5511{i:09d}'
+        for n, body in enumerate(flows[i]):
+            form = {'From': phone, 'To': TWILIO_NUMBER, 'Body': body, 'MessageSid': f'SMbench{i}x{n}'}
+            start = time.perf_counter()
+            try:
+                status = post(form)
+            except Exception:
+                status = 500
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if status >= 400:
+                    errors[0] += 1
+
+    queries_before = query_count[0]
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(run_user, range(args.users)))
+        elapsed = time.perf_counter() - started
+        if not args.url:
+            # Relatórios terminam num processo separado e ainda enviam o link pela fila
+            from reports import get_report_jobs
+            report_jobs = get_report_jobs()
+            while report_jobs.stats()['in_flight']:
+                time.sleep(0.05)
+            twilio_helpers.get_dispatcher().drain(timeout=60)
+
+    turns = len(latencies)
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'users': args.users,
+        'concurrency': args.concurrency,
+        'contracts': args.contracts,
+        'tickets_per_contract': args.tickets_per_contract,
+        'turns': turns,
+        'errors': errors[0],
+        'elapsed_s': elapsed,
+        'throughput_turns_per_s': turns / elapsed if elapsed else 0.0,
+        'latency_p50_ms': percentile(latencies, 50) * 1000,
+        'latency_p95_ms': percentile(latencies, 95) * 1000,
+        'latency_p99_ms': percentile(latencies, 99) * 1000,
+        'db_queries_per_turn': (query_count[0] - queries_before) / turns if turns and not args.url else None,
+        'messages_sent': fake_client.messages.count if not args.url else None,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("\nComparação com", args.compare)
+        for key, value in results.items():
+            old = baseline.get(key)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+                print(f"  {key:28} {old:12.3f} -> {value:12.3f} ({(value - old) / old * 100:+.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
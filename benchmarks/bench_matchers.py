@@ -0,0 +1,73 @@
+# benchmarks/bench_matchers.py
+# Mede o custo por mensagem dos matchers da tabela de estados, sem banco nem Twilio:
+# normalização + todas as transições do estado até a primeira que casa.
+#
+#   python benchmarks/bench_matchers.py --iterations 200000
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Mensagens típicas por estado, incluindo acentos, pontuação e erros de digitação
+SAMPLES = {
+    'StartState': ['Olá!', 'oi', 'Bom dia, tudo bem?', 'boa tardee', '12345', 'CT-2024/001', 'quero ver meus chamados'],
+    'SelectOptionState': ['1', '2', ' 2. ', 'Ver chamados', 'relatório', 'relatorioo', '3'],
+    'SelectCallState': ['42', '#7', 'mais', 'Próxima', 'voltar', 'votlar', 'abc'],
+    'SelectReturnState': ['1', '2', 'Menu', 'encerar', 'x'],
+    'GenerateReportState': ['1', 'PDF', 'Excel', 'csv', 'qualquer'],
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=100000, help='mensagens avaliadas por estado')
+    parser.add_argument('--output', help='arquivo JSON com os resultados')
+    return parser.parse_args()
+
+
+def first_match(state, message):
+    from matchers import normalize
+    text = normalize(message)
+    for index, transition in enumerate(state.transitions):
+        value = transition.matcher.match(message, text)
+        if value is not None:
+            return index, value
+    return None, None
+
+
+def main():
+    args = parse_args()
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    os.environ.setdefault('TWILIO_ACCOUNT_SID', 'ACbenchmark')
+    os.environ.setdefault('TWILIO_AUTH_TOKEN', 'benchmark')
+    from matchers import normalize
+    from states import STATE_MACHINE
+
+    results = {}
+    for state_name, messages in SAMPLES.items():
+        state = STATE_MACHINE.states[state_name]
+        transitions = state.transitions
+        start = time.perf_counter()
+        for i in range(args.iterations):
+            message = messages[i % len(messages)]
+            text = normalize(message)
+            for transition in transitions:
+                if transition.matcher.match(message, text) is not None:
+                    break
+        elapsed = time.perf_counter() - start
+        results[state_name] = {
+            'us_per_message': round(elapsed / args.iterations * 1e6, 3),
+            'matches': {message: repr(first_match(state, message)) for message in messages},
+        }
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+# benchmarks/bench_send.py
+# Vazão de envio para a API de mensagens, sem sair da máquina: sobe o twilio_standin.py com uma
+# latência de rede simulada e compara os transportes com a mesma concorrência.
+#
+#   python benchmarks/bench_send.py --messages 2000 --concurrency 16 --latency-ms 50
+#
+#   no-keepalive - uma conexão nova por mensagem (como sem pool)
+#   sdk          - twilio.rest.Client com o pool keep-alive, pelo MessageDispatcher
+#   http         - HTTPTransport pelo MessageDispatcher
+#   async        - AsyncTransport.send_batch com asyncio
+#   bridge       - TWILIO_TRANSPORT=async: AsyncBridge pelo MessageDispatcher, como no app
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ACCOUNT_SID = 'ACbenchmark'
+AUTH_TOKEN = 'benchmark'
+FROM_NUMBER = '+15550000000'
+MODES = ['no-keepalive', 'sdk', 'http', 'async', 'bridge']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--recipients', type=int, default=500, help='destinatários distintos')
+    parser.add_argument('--concurrency', type=int, default=16, help='workers do dispatcher / envios simultâneos')
+    parser.add_argument('--latency-ms', type=float, default=50, help='latência simulada da API')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--output', help='arquivo JSON com os resultados')
+    return parser.parse_args()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_standin(port, latency_ms):
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'twilio_standin.py'),
+                                '--port', str(port), '--latency-ms', str(latency_ms)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/stats')
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('twilio_standin.py não respondeu')
+
+
+def standin_stats(base_url):
+    with urllib.request.urlopen(base_url + '/stats') as response:
+        return json.load(response)
+
+
+def reset_standin(base_url):
+    urllib.request.urlopen(urllib.request.Request(base_url + '/reset', data=b'', method='POST')).close()
+
+
+def messages(count, recipients):
+    return [(f'+5511{i % recipients:09d}', f'Mensagem de teste {i}', FROM_NUMBER) for i in range(count)]
+
+
+def run_dispatcher(send_func, batch, concurrency):
+    from dispatcher import MessageDispatcher
+    dispatcher = MessageDispatcher(send_func, workers=concurrency, rate=1e9, burst=1e9,
+                                   max_queue_size=len(batch) + 1, max_retries=0)
+    dispatcher.start()
+    started = time.perf_counter()
+    for to_number, body, from_number in batch:
+        dispatcher.submit(to_number, [body], from_number)
+    dispatcher.drain(timeout=600)
+    elapsed = time.perf_counter() - started
+    metrics = dispatcher.metrics()
+    dispatcher.shutdown(timeout=5)
+    return elapsed, metrics['failed']
+
+
+def run_mode(mode, batch, concurrency, base_url):
+    import twilio_helpers
+    from twilio_transport import AsyncTransport, messages_path, transport_options
+    if mode == 'no-keepalive':
+        import requests
+        url = base_url + messages_path(ACCOUNT_SID)
+
+        def send(to_number, body, from_number):
+            response = requests.post(url, data={'To': to_number, 'From': from_number, 'Body': body},
+                                     auth=(ACCOUNT_SID, AUTH_TOKEN), headers={'Connection': 'close'}, timeout=10)
+            response.raise_for_status()
+        return run_dispatcher(send, batch, concurrency)
+    if mode in ('sdk', 'http', 'bridge'):
+        twilio_helpers.TWILIO_TRANSPORT = 'async' if mode == 'bridge' else mode
+        client = twilio_helpers.create_client(ACCOUNT_SID, AUTH_TOKEN)
+
+        def send(to_number, body, from_number):
+            client.messages.create(body=body, from_=from_number, to=to_number)
+        return run_dispatcher(send, batch, concurrency)
+    if mode == 'async':
+        async def main():
+            options = transport_options(concurrency)
+            transport = AsyncTransport(ACCOUNT_SID, AUTH_TOKEN, concurrency=options.pop('pool_size'), **options)
+            started = time.perf_counter()
+            results = await transport.send_batch(batch)
+            elapsed = time.perf_counter() - started
+            await transport.close()
+            return elapsed, sum(1 for r in results if isinstance(r, Exception))
+        return asyncio.run(main())
+    raise ValueError(f'modo desconhecido: {mode}')
+
+
+def main():
+    args = parse_args()
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    os.environ['TWILIO_API_URL'] = base_url
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['DISPATCHER_WORKERS'] = str(args.concurrency)
+    standin = start_standin(port, args.latency_ms)
+    batch = messages(args.messages, args.recipients)
+    results = {'messages': args.messages, 'concurrency': args.concurrency, 'latency_ms': args.latency_ms, 'modes': {}}
+    try:
+        for mode in args.modes.split(','):
+            reset_standin(base_url)
+            elapsed, failed = run_mode(mode, batch, args.concurrency, base_url)
+            results['modes'][mode] = {
+                'elapsed_s': round(elapsed, 3),
+                'messages_per_s': round(args.messages / elapsed, 1),
+                'failed': failed,
+                'accepted_by_server': standin_stats(base_url)['accepted'],
+            }
+    finally:
+        standin.terminate()
+        standin.wait()
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/bench_startup.py
+# Mede o boot de um worker (importar app e chamar create_app) em processos novos e confere o orçamento:
+# tempo mediano abaixo de --budget-ms e nenhuma dependência pesada carregada antes do primeiro uso.
+#
+#   python benchmarks/bench_startup.py --runs 10 --budget-ms 600
+#
+# Sai com código 1 se o orçamento for estourado, para poder rodar no CI.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Só devem ser importados quando alguém pede relatório ou quando a primeira mensagem é enviada
+HEAVY_MODULES = ['pandas', 'pdfkit', 'reportlab', 'openpyxl', 'twilio.rest', 'reports']
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'loaded': [m for m in %r if m in sys.modules],
+}))
+''' % (HEAVY_MODULES,)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10, help='processos novos medidos')
+    parser.add_argument('--budget-ms', type=float, default=600, help='limite para o tempo mediano de boot')
+    parser.add_argument('--importtime', action='store_true', help='mostra os módulos mais lentos (python -X importtime)')
+    parser.add_argument('--output', help='arquivo JSON com os resultados')
+    return parser.parse_args()
+
+
+def child_env():
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'startup.db'))
+    env.setdefault('TWILIO_ACCOUNT_SID', 'ACbenchmark')
+    env.setdefault('TWILIO_AUTH_TOKEN', 'benchmark')
+    env.setdefault('LOG_LEVEL', 'WARNING')
+    return env
+
+
+def slowest_imports(env, limit=15):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.strip()))
+    rows.sort(reverse=True)
+    return [{'module': name, 'cumulative_ms': round(us / 1000, 2)} for us, name in rows[:limit]]
+
+
+def main():
+    args = parse_args()
+    env = child_env()
+    runs = []
+    for _ in range(args.runs):
+        result = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env,
+                                capture_output=True, text=True, check=True)
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    totals = [r['import_ms'] + r['create_app_ms'] for r in runs]
+    loaded = sorted({m for r in runs for m in r['loaded']})
+    results = {
+        'runs': args.runs,
+        'budget_ms': args.budget_ms,
+        'startup_p50_ms': round(statistics.median(totals), 2),
+        'startup_max_ms': round(max(totals), 2),
+        'import_p50_ms': round(statistics.median(r['import_ms'] for r in runs), 2),
+        'create_app_p50_ms': round(statistics.median(r['create_app_ms'] for r in runs), 2),
+        'heavy_modules_loaded': loaded,
+    }
+    if args.importtime:
+        results['slowest_imports'] = slowest_imports(env)
+    results['ok'] = results['startup_p50_ms'] <= args.budget_ms and not loaded
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    sys.exit(0 if results['ok'] else 1)
+
+
+if __name__ == '__main__':
+    main()
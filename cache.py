@@ -0,0 +1,55 @@
+# cache.py
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    # Cache em memória com limite de tamanho (LRU) e expiração por item (TTL)
+    def __init__(self, max_size=10000, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return default
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._items[key] = (value, expires_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)  # Remove o item usado há mais tempo
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def purge(self):
+        # Remove os itens expirados; sem isso eles só saem quando são lidos ou empurrados pelo LRU
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._items.items() if expires_at < now]
+            for key in expired:
+                del self._items[key]
+        return len(expired)
+
+    def __len__(self):
+        # Conta só os itens válidos (ex.: gauge de conversas ativas)
+        self.purge()
+        return len(self._items)
@@ -1,11 +1,12 @@
 # context.py
 class ConversationContext:
-    def __init__(self, state_cls, phone_number, my_twilio_number):
-        self.state = state_cls(self)  # Inicializa o estado passando a si mesmo como contexto
+    def __init__(self, state, phone_number, my_twilio_number):
+        self.state = state  # Nome do estado atual na tabela de transições (states.STATE_MACHINE)
         self.phone_number = phone_number
         self.my_twilio_number = my_twilio_number
         self.contract_id = None
         self.call_number = None
+        self.calls_cursor = None  # [data_chamado, id] do primeiro e do último chamado da página listada
 
     def set_contract_id(self, contract_id):
         self.contract_id = contract_id
@@ -13,8 +14,25 @@ class ConversationContext:
     def set_call_number(self, call_number):
         self.call_number = call_number
 
-    def request(self, message):
-        response = self.state.handle_request(message)
-        # Supondo que auto_respond possa retornar mensagens adicionais para serem processadas
-        auto_response = self.state.auto_respond() if hasattr(self.state, 'auto_respond') else []
-        return [response] + auto_response if isinstance(auto_response, list) else response
+    def set_calls_cursor(self, calls_cursor):
+        self.calls_cursor = calls_cursor
+
+    def to_dict(self):
+        # Estado compacto da conversa, usado pelos session stores serializados
+        return {
+            'state': self.state,
+            'phone_number': self.phone_number,
+            'my_twilio_number': self.my_twilio_number,
+            'contract_id': self.contract_id,
+            'call_number': self.call_number,
+            'calls_cursor': self.calls_cursor,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        context = cls(data['state'], data['phone_number'], data['my_twilio_number'])
+        context.contract_id = data['contract_id']
+        context.call_number = data['call_number']
+        context.calls_cursor = data.get('calls_cursor')
+        return context
+
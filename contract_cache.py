@@ -0,0 +1,90 @@
+# contract_cache.py
+import os
+import threading
+from sqlalchemy import event, inspect
+from cache import TTLCache
+from database import read_session
+from models import Contrato
+from invalidation import register
+from tenants import PerTenant
+
+_MISSING = object()
+
+
+class ContractCache:
+    # Cache read-through de número de contrato -> id, com cache negativo para números desconhecidos
+    def __init__(self, loader, max_size=50000, ttl=600, negative_ttl=30):
+        self.loader = loader
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+        self._known = {}  # Preenchido pelo prewarm com todos os contratos existentes
+        self._lock = threading.Lock()
+
+    def get(self, contract_number):
+        contract_id = self._known.get(contract_number)
+        if contract_id is not None:
+            return contract_id
+        contract_id = self._cache.get(contract_number, _MISSING)
+        if contract_id is not _MISSING:
+            return contract_id
+        contract_id = self.loader(contract_number)
+        self._cache.set(contract_number, contract_id, ttl=self.ttl if contract_id else self.negative_ttl)
+        return contract_id
+
+    def prewarm(self, pairs):
+        known = dict(pairs)
+        with self._lock:
+            self._known = known
+        self._cache.clear()
+        return len(known)
+
+    def invalidate(self, contract_number=None):
+        # Sem argumento, descarta tudo (ex.: depois de uma importação em massa)
+        with self._lock:
+            if contract_number is None:
+                self._known = {}
+            else:
+                self._known.pop(contract_number, None)
+        if contract_number is None:
+            self._cache.clear()
+        else:
+            self._cache.delete(contract_number)
+
+
+def load_contract_id(contract_number):
+    # Busca só a coluna id, sem montar o objeto Contrato inteiro
+    row = read_session.query(Contrato.id).filter_by(numero_contrato=contract_number).first()
+    return row[0] if row else None
+
+
+# Um cache por tenant: números de contrato e ids só fazem sentido dentro do banco de cada empresa
+contract_cache = PerTenant(lambda: ContractCache(
+    load_contract_id,
+    max_size=int(os.getenv('CONTRACT_CACHE_SIZE', '50000')),
+    ttl=int(os.getenv('CONTRACT_CACHE_TTL', '600')),
+    negative_ttl=int(os.getenv('CONTRACT_CACHE_NEGATIVE_TTL', '30')),
+))
+
+
+def prewarm_contracts():
+    # Carrega todos os números de contrato de uma vez; precisa de um app context
+    rows = read_session.query(Contrato.numero_contrato, Contrato.id).yield_per(10000)
+    return contract_cache.prewarm((numero, contract_id) for numero, contract_id in rows)
+
+
+def invalidate_contract(contract_number=None):
+    contract_cache.invalidate(contract_number)
+
+
+register('contract', invalidate_contract)
+
+
+@event.listens_for(Contrato, 'after_insert')
+@event.listens_for(Contrato, 'after_update')
+@event.listens_for(Contrato, 'after_delete')
+def _invalidate_on_change(mapper, connection, target):
+    # Alterações feitas pelo próprio app invalidam o cache, inclusive o número antigo numa renomeação
+    history = inspect(target).attrs.numero_contrato.history
+    for contract_number in {target.numero_contrato, *history.deleted}:
+        contract_cache.invalidate(contract_number)
@@ -0,0 +1,188 @@
+# contract_summary.py
+# Resumo desnormalizado por contrato (tabela resumo_contratos): total de chamados e datas mais recentes.
+# O menu responde com uma leitura pela chave primária em vez de varrer chamados.
+#
+#   refresh_contracts(session, ids) - recalcula só os contratos informados (importação e refresher)
+#   rebuild_all(session)            - recalcula todos com INSERT ... SELECT ... GROUP BY
+#
+# Para quem grava chamados fora do import_data.py, o refresher acompanha a marca d'água (data_atualizacao, id):
+#
+#   python contract_summary.py            - refresher contínuo, um por tenant
+#   python contract_summary.py --rebuild  - só a reconstrução completa
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import and_, delete, func, insert, literal, or_, select
+from database import db, read_session, get_app
+from models import Chamado, Contrato, ResumoContrato
+from tenants import registry as tenants, use_tenant
+from instrumentation import log_event, logger, setup_logging
+
+REFRESH_BATCH = 500  # Contratos por comando no refresh parcial (limite do IN)
+
+
+def _aggregate(contract_ids=None):
+    # Uma linha por contrato, inclusive os sem chamados (LEFT JOIN)
+    query = select(
+        Contrato.id, func.count(Chamado.id), func.max(Chamado.data_chamado), func.max(Chamado.data_atualizacao),
+        literal(datetime.now()),
+    ).select_from(Contrato).outerjoin(Chamado, Chamado.contrato_id == Contrato.id).group_by(Contrato.id)
+    if contract_ids is not None:
+        query = query.where(Contrato.id.in_(contract_ids))
+    return query
+
+
+def _write(session, contract_ids=None):
+    columns = ['contrato_id', 'total_chamados', 'data_ultimo_chamado', 'data_ultima_atualizacao', 'atualizado_em']
+    stmt = delete(ResumoContrato)
+    if contract_ids is not None:
+        stmt = stmt.where(ResumoContrato.contrato_id.in_(contract_ids))
+    session.execute(stmt)
+    session.execute(insert(ResumoContrato).from_select(columns, _aggregate(contract_ids)))
+
+
+def refresh_contracts(session, contract_ids):
+    # Recalcula os contratos informados a partir dos chamados (índice ix_chamados_contrato_data);
+    # quem chama faz o commit
+    contract_ids = sorted(set(contract_ids))
+    for i in range(0, len(contract_ids), REFRESH_BATCH):
+        _write(session, contract_ids[i:i + REFRESH_BATCH])
+    return len(contract_ids)
+
+
+def rebuild_all(session):
+    # Reconstrução completa em poucos comandos set-based; numa transação, quem lê continua vendo o resumo antigo
+    _write(session)
+    return session.scalar(select(func.count()).select_from(ResumoContrato))
+
+
+def get_summary(contract_id):
+    # Uma leitura pela chave primária; None se o contrato ainda não foi resumido
+    return read_session.get(ResumoContrato, contract_id)
+
+
+def status_line(summary):
+    # Ex.: '3 chamados, último atualizado em 12-01-24.'
+    if summary.total_chamados == 0:
+        return 'Nenhum chamado registrado.'
+    count = '1 chamado' if summary.total_chamados == 1 else f'{summary.total_chamados} chamados'
+    return f'{count}, último atualizado em {summary.data_ultima_atualizacao:%d-%m-%y}.'
+
+
+class SummaryRefresher:
+    # Lê os chamados alterados depois da marca d'água (índice ix_chamados_data_atualizacao) e recalcula
+    # os contratos deles. Chamados apagados não aparecem na varredura: a reconstrução periódica cobre.
+    def __init__(self, state_path, batch_size=5000, lookback=60, rebuild_interval=3600, tenant=None):
+        self.state_path = state_path
+        self.batch_size = batch_size
+        self.lookback = timedelta(seconds=lookback)
+        self.rebuild_interval = rebuild_interval
+        self.tenant = tenant
+        self.mark = self._load_mark()
+        self._rebuilt_at = 0.0 if self.mark is None else time.monotonic()
+
+    def _load_mark(self):
+        try:
+            with open(self.state_path) as f:
+                data = json.load(f)
+            return datetime.fromisoformat(data['data_atualizacao']), data['id']
+        except FileNotFoundError:
+            return None  # Primeira execução: começa com a reconstrução completa
+
+    def _save_mark(self):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'data_atualizacao': self.mark[0].isoformat(), 'id': self.mark[1]}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def fetch_changes(self, after):
+        data_atualizacao, call_id = after
+        return db.session.query(Chamado.id, Chamado.contrato_id, Chamado.data_atualizacao).filter(or_(
+            Chamado.data_atualizacao > data_atualizacao,
+            and_(Chamado.data_atualizacao == data_atualizacao, Chamado.id > call_id),
+        )).order_by(Chamado.data_atualizacao.asc(), Chamado.id.asc()).limit(self.batch_size).all()
+
+    def rebuild(self):
+        # A marca vem antes da reconstrução: o que mudar durante ela é relido no próximo ciclo
+        mark = (datetime.now(), 0)
+        count = rebuild_all(db.session)
+        db.session.commit()
+        self.mark = mark
+        self._save_mark()
+        self._rebuilt_at = time.monotonic()
+        return count
+
+    def run_once(self):
+        # Um ciclo; retorna quantos contratos foram recalculados
+        if self.mark is None or time.monotonic() - self._rebuilt_at > self.rebuild_interval:
+            return self.rebuild()
+        refreshed = 0
+        # Começa um pouco antes da marca para pegar transações que gravaram uma data_atualizacao antiga
+        cursor = (self.mark[0] - self.lookback, 0)
+        while True:
+            changes = self.fetch_changes(cursor)
+            if not changes:
+                break
+            refreshed += refresh_contracts(db.session, {chamado.contrato_id for chamado in changes})
+            db.session.commit()
+            last = changes[-1]
+            cursor = (last.data_atualizacao, last.id)
+            if cursor > self.mark:
+                self.mark = cursor
+                self._save_mark()
+            if len(changes) < self.batch_size:
+                break
+        return refreshed
+
+    def run_forever(self, interval):
+        while True:
+            start = time.monotonic()
+            try:
+                with get_app().app_context(), use_tenant(self.tenant):
+                    refreshed = self.run_once()
+                if refreshed:
+                    log_event('summaries_refreshed', count=refreshed, mark=self.mark[0].isoformat(),
+                              tenant=self.tenant.name if self.tenant else None)
+            except Exception:
+                logger.exception('summary_refresh_failed')
+            time.sleep(max(0.0, interval - (time.monotonic() - start)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rebuild', action='store_true', help='reconstrói todos os resumos e sai')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    setup_logging()
+    args = parse_args()
+    state_path = os.getenv('SUMMARY_STATE_PATH', '/tmp/chatbot_summary_mark.json')
+    threads = []
+    # Um refresher por banco, cada um com a marca d'água num arquivo próprio
+    for tenant in tenants.tenants.values():
+        if not tenant.is_default and tenant.database_url is None:
+            continue  # Usa o banco do tenant padrão, que já tem o seu refresher
+        refresher = SummaryRefresher(
+            state_path if tenant.is_default else f'{os.path.splitext(state_path)[0]}.{tenant.name}.json',
+            batch_size=int(os.getenv('SUMMARY_BATCH_SIZE', '5000')),
+            lookback=int(os.getenv('SUMMARY_LOOKBACK', '60')),
+            rebuild_interval=int(os.getenv('SUMMARY_REBUILD_INTERVAL', '3600')),
+            tenant=tenant,
+        )
+        if args.rebuild:
+            started = time.perf_counter()
+            with get_app().app_context(), use_tenant(tenant):
+                count = refresher.rebuild()
+            log_event('summaries_rebuilt', count=count, tenant=tenant.name,
+                      elapsed_s=round(time.perf_counter() - started, 2))
+            continue
+        thread = threading.Thread(target=refresher.run_forever, args=(float(os.getenv('SUMMARY_INTERVAL', '30')),),
+                                  name=f'summary-{tenant.name}')
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
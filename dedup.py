@@ -0,0 +1,87 @@
+# dedup.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from database import SQLiteConnections
+
+
+class MemoryDedupStore:
+    # Conjunto de MessageSid já vistos, com limite de tamanho e expiração
+    def __init__(self, max_size=100000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, message_sid):
+        # Retorna (True, None) para uma entrega nova; (False, status) para uma repetida.
+        # O status é None enquanto a primeira entrega ainda está sendo processada.
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(message_sid)
+            if item is not None and item[1] >= now:
+                return False, item[0]
+            self._items[message_sid] = (None, now + self.ttl)
+            self._items.move_to_end(message_sid)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+            return True, None
+
+    def complete(self, message_sid, status):
+        with self._lock:
+            if message_sid in self._items:
+                self._items[message_sid] = (status, self._items[message_sid][1])
+
+    def release(self, message_sid):
+        # Libera o MessageSid para que a próxima tentativa da Twilio seja processada
+        with self._lock:
+            self._items.pop(message_sid, None)
+
+
+class SQLiteDedupStore:
+    # Mesmo contrato do MemoryDedupStore, mas compartilhado entre workers via arquivo SQLite
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self._connections = SQLiteConnections(path)
+        self._connections.get().execute(
+            'CREATE TABLE IF NOT EXISTS seen_messages ('
+            'message_sid TEXT PRIMARY KEY, status INTEGER, expires_at REAL NOT NULL)'
+        )
+        self._connections.get().execute(
+            'CREATE INDEX IF NOT EXISTS ix_seen_messages_expires_at ON seen_messages (expires_at)'
+        )
+
+    def claim(self, message_sid):
+        now = time.time()
+        conn = self._connections.get()
+        conn.execute('DELETE FROM seen_messages WHERE expires_at < ?', (now,))
+        # INSERT OR IGNORE é atômico, então só um worker ganha a entrega
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO seen_messages (message_sid, status, expires_at) VALUES (?, NULL, ?)',
+            (message_sid, now + self.ttl)
+        )
+        if cursor.rowcount:
+            return True, None
+        row = conn.execute('SELECT status FROM seen_messages WHERE message_sid = ?', (message_sid,)).fetchone()
+        return False, row[0] if row else None
+
+    def complete(self, message_sid, status):
+        self._connections.get().execute(
+            'UPDATE seen_messages SET status = ? WHERE message_sid = ?', (status, message_sid)
+        )
+
+    def release(self, message_sid):
+        self._connections.get().execute('DELETE FROM seen_messages WHERE message_sid = ?', (message_sid,))
+
+
+def create_dedup_store():
+    # Escolhe o backend pelas variáveis de ambiente (DEDUP_STORE=memory|sqlite)
+    backend = os.getenv('DEDUP_STORE', 'memory')
+    ttl = int(os.getenv('DEDUP_TTL', '3600'))
+    if backend == 'sqlite':
+        return SQLiteDedupStore(os.getenv('DEDUP_SQLITE_PATH', '/tmp/chatbot_dedup.db'), ttl=ttl)
+    if backend == 'memory':
+        return MemoryDedupStore(max_size=int(os.getenv('DEDUP_MAX_SIZE', '100000')), ttl=ttl)
+    raise ValueError(f"DEDUP_STORE desconhecido: {backend}")
@@ -0,0 +1,88 @@
+# dispatcher.py
+import logging
+import threading
+import time
+from collections import deque
+from rate_limit import TokenBucket
+from worker_pool import KeyedWorkerPool
+from instrumentation import log_event
+
+
+class MessageDispatcher:
+    # Envia mensagens com um número fixo de workers, mantendo a ordem por destinatário
+    def __init__(self, send_func, workers=8, rate=1.0, burst=1, max_queue_size=10000,
+                 max_retries=3, backoff=0.5):
+        self.send_func = send_func
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self._pool = KeyedWorkerPool(self._deliver, workers=workers, max_queue_size=max_queue_size,
+                                     name='dispatcher')
+        self._buckets = {}  # um limitador por número Twilio de origem
+        self._lock = threading.Lock()
+
+        self._sent = 0
+        self._failed = 0
+        self._retried = 0
+        self._latencies = deque(maxlen=1000)
+
+    def start(self):
+        self._pool.start()
+
+    def submit(self, to_number, messages, from_number):
+        now = time.monotonic()
+        self._pool.submit(to_number, [(from_number, body, now) for body in messages])
+
+    def _bucket(self, from_number):
+        with self._lock:
+            bucket = self._buckets.get(from_number)
+            if bucket is None:
+                bucket = self._buckets[from_number] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def _deliver(self, to_number, item):
+        from_number, body, enqueued_at = item
+        self._bucket(from_number).acquire()
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.send_func(to_number, body, from_number)
+                with self._lock:
+                    self._sent += 1
+                    self._latencies.append(time.monotonic() - enqueued_at)
+                return
+            except Exception as e:
+                status = getattr(e, 'status', None)
+                # Erros 4xx (exceto 429) não vão mudar numa nova tentativa
+                retryable = status is None or status == 429 or status >= 500
+                if not retryable or attempt == self.max_retries:
+                    log_event('send_failed', logging.ERROR, to=to_number, attempts=attempt + 1, error=repr(e))
+                    with self._lock:
+                        self._failed += 1
+                    return
+                with self._lock:
+                    self._retried += 1
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def drain(self, timeout=None):
+        # Espera todas as mensagens enfileiradas serem enviadas
+        return self._pool.drain(timeout)
+
+    def shutdown(self, timeout=None):
+        return self._pool.shutdown(timeout)
+
+    def metrics(self):
+        stats = self._pool.stats()
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                'queue_depth': stats['queue_depth'],
+                'queued_recipients': stats['queued_keys'],
+                'in_flight': stats['in_flight'],
+                'sent': self._sent,
+                'failed': self._failed,
+                'retried': self._retried,
+                'send_latency_p50': latencies[len(latencies) // 2] if latencies else 0.0,
+                'send_latency_p95': latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+            }
@@ -0,0 +1,351 @@
+# import_data.py
+# Importação em massa de contratos e chamados a partir de CSV/XLSX, e geração de dados sintéticos.
+#
+#   python import_data.py import chamados.csv --chunk-size 5000
+#   python import_data.py import chamados.xlsx --dry-run       # só mostra o que mudaria
+#   python import_data.py generate --contracts 10000 --tickets-per-contract 200 --output chamados.csv
+#   python import_data.py generate --contracts 10000 --tickets-per-contract 200   # direto no banco
+#   python import_data.py --tenant acme import chamados.csv    # banco de um tenant de TENANTS_FILE
+#
+# Colunas: id, numero_contrato, descricao, data_chamado, data_atualizacao, ultima_atualizacao.
+# O id é o do sistema de chamados: linhas com um id existente atualizam o chamado.
+import argparse
+import csv
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from database import db, get_app
+from models import Contrato, Chamado
+from invalidation import publish
+from contract_summary import rebuild_all, refresh_contracts
+from tenants import registry as tenants, use_tenant
+
+COLUMNS = ['id', 'numero_contrato', 'descricao', 'data_chamado', 'data_atualizacao', 'ultima_atualizacao']
+UPDATE_COLUMNS = ['contrato_id', 'descricao', 'data_chamado', 'data_atualizacao', 'ultima_atualizacao']
+DATE_FORMATS = ['%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y']
+# Acima disso a importação invalida os caches inteiros em vez de chave por chave
+MAX_INVALIDATION_KEYS = 1000
+# Acima disso os resumos por contrato são reconstruídos todos de uma vez em vez de contrato a contrato
+MAX_SUMMARY_REFRESH = 5000
+
+
+class RowError(ValueError):
+    pass
+
+
+def parse_date(value):
+    if hasattr(value, 'to_pydatetime'):  # pandas.Timestamp
+        return value.to_pydatetime()
+    if isinstance(value, datetime):
+        return value
+    text = str(value).strip()
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise RowError(f"data inválida: {text!r}")
+
+
+def clean_row(row):
+    # Valida e normaliza uma linha da planilha; textos são cortados no tamanho das colunas
+    missing = [c for c in COLUMNS if row.get(c) in (None, '')]
+    if missing:
+        raise RowError(f"colunas vazias: {', '.join(missing)}")
+    try:
+        ticket_id = int(row['id'])
+    except (TypeError, ValueError):
+        raise RowError(f"id inválido: {row['id']!r}")
+    return {
+        'id': ticket_id,
+        'numero_contrato': str(row['numero_contrato']).strip()[:255],
+        'descricao': str(row['descricao'])[:255],
+        'data_chamado': parse_date(row['data_chamado']),
+        'data_atualizacao': parse_date(row['data_atualizacao']),
+        'ultima_atualizacao': str(row['ultima_atualizacao'])[:255],
+    }
+
+
+def read_csv(path, chunk_size):
+    import pandas as pd
+    # Tudo como texto: números de contrato com zeros à esquerda não podem virar inteiros
+    for frame in pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False):
+        yield frame.to_dict('records')
+
+
+def read_xlsx(path, chunk_size):
+    # O pandas lê o .xlsx inteiro de uma vez; o modo read_only do openpyxl lê linha a linha
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    header = [str(c).strip() if c is not None else '' for c in next(rows)]
+    chunk = []
+    for values in rows:
+        chunk.append(dict(zip(header, values)))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+    workbook.close()
+
+
+def read_chunks(path, chunk_size):
+    if path.lower().endswith('.xlsx'):
+        return read_xlsx(path, chunk_size)
+    return read_csv(path, chunk_size)
+
+
+def synthetic_rows(contracts, tickets_per_contract, seed=42, start=datetime(2024, 1, 1)):
+    # Dados sintéticos para testes de carga; ids e números de contrato previsíveis (CT000001, ...)
+    rng = random.Random(seed)
+    problems = ['falha na conexão', 'lentidão', 'sem sinal', 'troca de equipamento', 'cobrança indevida',
+                'mudança de endereço', 'instalação', 'queda intermitente']
+    updates = ['Técnico agendado para verificação', 'Aguardando retorno do cliente', 'Em análise pela equipe',
+               'Equipamento enviado', 'Chamado encerrado']
+    ticket_id = 0
+    for contract in range(1, contracts + 1):
+        numero = f'CT{contract:06d}'
+        for n in range(tickets_per_contract):
+            ticket_id += 1
+            data_chamado = start + timedelta(hours=ticket_id)
+            yield {
+                'id': ticket_id,
+                'numero_contrato': numero,
+                'descricao': f'Chamado {n} do contrato {contract}: {rng.choice(problems)}',
+                'data_chamado': data_chamado,
+                'data_atualizacao': data_chamado + timedelta(minutes=rng.randint(1, 7 * 24 * 60)),
+                'ultima_atualizacao': rng.choice(updates),
+            }
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def upsert_statement(table, key_columns, update_columns):
+    # INSERT ... ON DUPLICATE KEY UPDATE no MySQL, ON CONFLICT no SQLite/PostgreSQL.
+    # Sem update_columns, linhas que já existem são ignoradas.
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        if not update_columns:
+            return stmt.prefix_with('IGNORE')
+        return stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in update_columns})
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        if not update_columns:
+            return stmt.on_conflict_do_nothing(index_elements=key_columns)
+        return stmt.on_conflict_do_update(index_elements=key_columns,
+                                          set_={c: stmt.excluded[c] for c in update_columns})
+    raise ValueError(f"Banco sem suporte a upsert em massa: {dialect}")
+
+
+class BulkImporter:
+    def __init__(self, chunk_size=5000, dry_run=False, max_diffs=20):
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.max_diffs = max_diffs
+        self.contract_ids = {}  # numero_contrato -> id, acumulado entre os lotes
+        self.stats = {'rows': 0, 'invalid': 0, 'new_contracts': 0, 'new_tickets': 0,
+                      'changed_tickets': 0, 'unchanged_tickets': 0}
+        self.errors = []
+        self.diffs = []
+        self._touched_contracts = set()
+        self._touched_tickets = set()
+        self._summary_contracts = set()  # Ids dos contratos com chamados novos ou alterados
+
+    def run(self, chunks):
+        for raw_rows in chunks:
+            rows = []
+            for raw in raw_rows:
+                self.stats['rows'] += 1
+                try:
+                    rows.append(clean_row(raw))
+                except RowError as e:
+                    self.stats['invalid'] += 1
+                    if len(self.errors) < self.max_diffs:
+                        self.errors.append(f"linha {self.stats['rows'] + 1}: {e}")
+            if rows:
+                self.import_chunk(rows)
+        if not self.dry_run:
+            self.update_summaries()
+            self.publish_invalidations()
+        return self.stats
+
+    def import_chunk(self, rows):
+        self.resolve_contracts({row['numero_contrato'] for row in rows})
+        self.diff(rows)
+        if self.dry_run:
+            return
+        tickets = [dict(row, contrato_id=self.contract_ids[row['numero_contrato']]) for row in rows]
+        for ticket in tickets:
+            del ticket['numero_contrato']
+        db.session.execute(upsert_statement(Chamado.__table__, ['id'], UPDATE_COLUMNS), tickets)
+        db.session.commit()
+
+    def resolve_contracts(self, numbers):
+        missing = sorted(n for n in numbers if n not in self.contract_ids)
+        if not missing:
+            return
+        self.contract_ids.update(self._lookup_contracts(missing))
+        new = [n for n in missing if n not in self.contract_ids]
+        self.stats['new_contracts'] += len(new)
+        self._touch(self._touched_contracts, new)
+        if not new:
+            return
+        if self.dry_run:
+            for n in new:
+                self.contract_ids[n] = None
+            return
+        db.session.execute(upsert_statement(Contrato.__table__, ['numero_contrato'], []),
+                           [{'numero_contrato': n} for n in new])
+        self.contract_ids.update(self._lookup_contracts(new))
+
+    def _lookup_contracts(self, numbers):
+        return dict(db.session.execute(
+            select(Contrato.numero_contrato, Contrato.id).where(Contrato.numero_contrato.in_(numbers))
+        ).all())
+
+    def diff(self, rows):
+        # Compara com o que já está no banco; no dry-run é o único efeito da importação
+        existing = {
+            row.id: row for row in db.session.execute(
+                select(Chamado.id, Chamado.contrato_id, Chamado.descricao, Chamado.data_chamado,
+                       Chamado.data_atualizacao, Chamado.ultima_atualizacao)
+                .where(Chamado.id.in_([r['id'] for r in rows]))
+            )
+        }
+        for row in rows:
+            contract_id = self.contract_ids[row['numero_contrato']]
+            current = existing.get(row['id'])
+            if current is None:
+                self.stats['new_tickets'] += 1
+                self._record_diff(f"chamado {row['id']}: novo no contrato {row['numero_contrato']}")
+            else:
+                changes = {'contrato_id': (current.contrato_id, contract_id)}
+                changes.update({c: (getattr(current, c), row[c]) for c in UPDATE_COLUMNS if c != 'contrato_id'})
+                changes = {c: (old, new) for c, (old, new) in changes.items() if old != new}
+                if not changes:
+                    self.stats['unchanged_tickets'] += 1
+                    continue
+                self.stats['changed_tickets'] += 1
+                self._record_diff(f"chamado {row['id']}: " + '; '.join(
+                    f"{c}: {old!r} -> {new!r}" for c, (old, new) in changes.items()))
+                if current.contrato_id != contract_id:
+                    self._touch(self._touched_tickets, [(current.contrato_id, row['id'])])
+                    self._summary_contracts.add(current.contrato_id)
+            if contract_id is not None:
+                self._touch(self._touched_tickets, [(contract_id, row['id'])])
+                self._summary_contracts.add(contract_id)
+
+    def _touch(self, touched, keys):
+        # Guarda no máximo MAX_INVALIDATION_KEYS chaves; além disso o cache inteiro será invalidado
+        if len(touched) <= MAX_INVALIDATION_KEYS:
+            touched.update(keys)
+
+    def _record_diff(self, line):
+        if len(self.diffs) < self.max_diffs:
+            self.diffs.append(line)
+
+    def update_summaries(self):
+        # Uma vez no fim, para não recalcular o mesmo contrato a cada lote (ver contract_summary.py)
+        if not self._summary_contracts:
+            return
+        if len(self._summary_contracts) > MAX_SUMMARY_REFRESH:
+            rebuild_all(db.session)
+        else:
+            refresh_contracts(db.session, self._summary_contracts)
+        db.session.commit()
+
+    def publish_invalidations(self):
+        # Os workers do webhook aplicam estas entradas nos próprios caches (ver invalidation.py)
+        entries = []
+        if len(self._touched_contracts) > MAX_INVALIDATION_KEYS:
+            entries.append(('contract', None))
+        else:
+            entries += [('contract', n) for n in sorted(self._touched_contracts)]
+        if len(self._touched_tickets) > MAX_INVALIDATION_KEYS:
+            entries.append(('ticket', None))
+        else:
+            entries += [('ticket', f'{c}:{t}') for c, t in sorted(self._touched_tickets)]
+        publish(db.session, entries)
+        db.session.commit()
+
+
+def write_csv(rows, path):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tenant', help='tenant de TENANTS_FILE cujo banco recebe os dados (padrão: o do app)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    importer = commands.add_parser('import', help='importa um CSV/XLSX')
+    importer.add_argument('path')
+    importer.add_argument('--chunk-size', type=int, default=5000)
+    importer.add_argument('--dry-run', action='store_true', help='mostra as diferenças sem gravar')
+    importer.add_argument('--max-diffs', type=int, default=20, help='diferenças de exemplo no relatório')
+    generator = commands.add_parser('generate', help='gera dados sintéticos')
+    generator.add_argument('--contracts', type=int, default=1000)
+    generator.add_argument('--tickets-per-contract', type=int, default=100)
+    generator.add_argument('--seed', type=int, default=42)
+    generator.add_argument('--chunk-size', type=int, default=10000)
+    generator.add_argument('--output', help='arquivo CSV; sem ele, grava direto no banco')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    started = time.perf_counter()
+    if args.command == 'generate' and args.output:
+        count = write_csv(synthetic_rows(args.contracts, args.tickets_per_contract, args.seed), args.output)
+        result = {'rows': count}
+    else:
+        tenant = tenants.get(args.tenant)
+        if tenant is None:
+            raise SystemExit(f'tenant desconhecido: {args.tenant}')
+        with get_app().app_context(), use_tenant(tenant):
+            if args.command == 'generate':
+                db.metadata.create_all(db.session.get_bind())
+                importer = BulkImporter(chunk_size=args.chunk_size)
+                rows = synthetic_rows(args.contracts, args.tickets_per_contract, args.seed)
+                # Linhas sintéticas já estão no formato certo; passam pelo mesmo caminho da importação
+                result = importer.run(chunked(rows, args.chunk_size))
+            else:
+                importer = BulkImporter(chunk_size=args.chunk_size, dry_run=args.dry_run, max_diffs=args.max_diffs)
+                result = dict(importer.run(read_chunks(args.path, args.chunk_size)),
+                              dry_run=args.dry_run, errors=importer.errors, diffs=importer.diffs)
+    result['elapsed_s'] = round(time.perf_counter() - started, 2)
+    print(json.dumps(result, indent=2, ensure_ascii=False, default=str))
+    return 0 if not result.get('invalid') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# inbound_limits.py
+import os
+import threading
+import time
+from cache import TTLCache
+from database import SQLiteConnections
+from rate_limit import TokenBucket
+
+
+class MemoryLimiterBackend:
+    # Um TokenBucket por chave ativa. Depois de idle_ttl sem mensagens o balde já estaria cheio de novo,
+    # então descartá-lo não muda nada; max_keys limita a memória mesmo sob ataque com muitos números.
+    def __init__(self, max_keys=100000, idle_ttl=600):
+        self.idle_ttl = idle_ttl
+        self._buckets = TTLCache(max_size=max_keys, ttl=idle_ttl)
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key, rate, burst):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(rate, burst)
+            self._buckets.set(key, bucket, ttl=max(self.idle_ttl, burst / rate))
+        return bucket.try_acquire()
+
+    def release(self, key, rate, burst):
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket.release()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteLimiterBackend:
+    # Baldes compartilhados entre os workers da máquina, num arquivo SQLite (mesmo esquema do dedup)
+    def __init__(self, path, idle_ttl=600, cleanup_every=1000):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.cleanup_every = cleanup_every
+        self._calls = 0
+        self._connections = SQLiteConnections(path)
+        self._connections.get().execute(
+            'CREATE TABLE IF NOT EXISTS rate_buckets ('
+            'bucket_key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+        self._connections.get().execute('CREATE INDEX IF NOT EXISTS ix_rate_buckets_updated_at ON rate_buckets (updated_at)')
+
+    def try_acquire(self, key, rate, burst):
+        now = time.time()
+        conn = self._connections.get()
+        # BEGIN IMMEDIATE serializa o ler-calcular-gravar entre processos
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM rate_buckets WHERE bucket_key = ?', (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            conn.execute('INSERT OR REPLACE INTO rate_buckets (bucket_key, tokens, updated_at) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._calls += 1
+        if self._calls % self.cleanup_every == 0:
+            conn.execute('DELETE FROM rate_buckets WHERE updated_at < ?', (now - self.idle_ttl,))
+        return wait
+
+    def release(self, key, rate, burst):
+        self._connections.get().execute('UPDATE rate_buckets SET tokens = MIN(?, tokens + 1) WHERE bucket_key = ?',
+                                   (burst, key))
+
+    def __len__(self):
+        return self._connections.get().execute('SELECT COUNT(*) FROM rate_buckets').fetchone()[0]
+
+
+class InboundLimiter:
+    # Limites aplicados a cada mensagem recebida, antes de qualquer acesso ao banco ou à fila de envio:
+    # por remetente (From), por número nosso (To), por tenant (inbound_rate em TENANTS_FILE) e um teto global.
+    # rate <= 0 desliga o limite.
+    def __init__(self, backend, from_limit, to_limit, global_limit):
+        self.backend = backend
+        self.limits = [
+            ('from', lambda frm, to: frm, from_limit),
+            ('to', lambda frm, to: to, to_limit),
+            ('global', lambda frm, to: '*', global_limit),
+        ]
+        self.limits = [(name, key, limit) for name, key, limit in self.limits if limit[0] > 0]
+
+    def check(self, phone_number, my_twilio_number, tenant=None):
+        # Retorna None se a mensagem pode seguir, ou (limite estourado, segundos até a próxima ficha).
+        # Se um limite recusa, as fichas já tiradas dos anteriores são devolvidas: uma mensagem recusada
+        # pelo teto global não gasta a cota do remetente.
+        checks = [(name, f'{name}:{key(phone_number, my_twilio_number)}', rate, burst)
+                  for name, key, (rate, burst) in self.limits]
+        if tenant is not None and tenant.inbound_rate > 0:
+            checks.append(('tenant', f'tenant:{tenant.name}', tenant.inbound_rate, tenant.inbound_burst))
+        acquired = []
+        for name, bucket_key, rate, burst in checks:
+            wait = self.backend.try_acquire(bucket_key, rate, burst)
+            if wait:
+                for taken in reversed(acquired):
+                    self.backend.release(*taken)
+                return name, wait
+            acquired.append((bucket_key, rate, burst))
+        return None
+
+
+def _limit(name, rate, burst):
+    return float(os.getenv(f'INBOUND_LIMIT_{name}_RATE', rate)), float(os.getenv(f'INBOUND_LIMIT_{name}_BURST', burst))
+
+
+def create_inbound_limiter():
+    # Escolhe o backend pelas variáveis de ambiente (INBOUND_LIMIT_BACKEND=memory|sqlite)
+    backend = os.getenv('INBOUND_LIMIT_BACKEND', 'memory')
+    idle_ttl = int(os.getenv('INBOUND_LIMIT_IDLE_TTL', '600'))
+    if backend == 'sqlite':
+        store = SQLiteLimiterBackend(os.getenv('INBOUND_LIMIT_SQLITE_PATH', '/tmp/chatbot_rate_limits.db'), idle_ttl=idle_ttl)
+    elif backend == 'memory':
+        store = MemoryLimiterBackend(max_keys=int(os.getenv('INBOUND_LIMIT_MAX_KEYS', '100000')), idle_ttl=idle_ttl)
+    else:
+        raise ValueError(f"INBOUND_LIMIT_BACKEND desconhecido: {backend}")
+    return InboundLimiter(
+        store,
+        from_limit=_limit('FROM', '1', '10'),  # mensagens por segundo e rajada por remetente
+        to_limit=_limit('TO', '100', '200'),
+        global_limit=_limit('GLOBAL', '500', '1000'),
+    )
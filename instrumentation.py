@@ -0,0 +1,275 @@
+# instrumentation.py
+import atexit
+import cProfile
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('chatbot')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        data.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+_listener = None
+
+
+def setup_logging():
+    # O hot path só coloca o registro numa fila; uma thread separada formata e escreve no stdout
+    global _listener
+    if _listener is not None:
+        return
+    log_queue = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+    logger.addHandler(_DroppingQueueHandler(log_queue))
+    logger.setLevel(os.getenv('LOG_LEVEL', 'INFO'))
+    logger.propagate = False
+
+
+def _restart_listener_after_fork():
+    # Com gunicorn --preload a thread do listener existe só no master; cada worker sobe a sua,
+    # com uma fila nova (a do master pode ter ficado com locks e esperas de threads que não existem aqui)
+    if _listener is None:
+        return
+    log_queue = queue.Queue(maxsize=_listener.queue.maxsize)
+    _listener.queue = log_queue
+    for handler in logger.handlers:
+        if isinstance(handler, _DroppingQueueHandler):
+            handler.queue = log_queue
+    _listener._thread = None
+    _listener.start()
+
+
+os.register_at_fork(after_in_child=_restart_listener_after_fork)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    # Se a fila de logs estiver cheia, descarta o registro em vez de bloquear a requisição
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def log_event(event_name, level=logging.INFO, **fields):
+    logger.log(level, event_name, extra={'fields': fields})
+
+
+def _format_labels(labelnames, labels):
+    if not labelnames:
+        return ''
+    pairs = ','.join('{}="{}"'.format(n, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                     for n, v in zip(labelnames, labels))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in self._values.items():
+                lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [contagem por bucket..., soma, total]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            data = self._values.get(labels)
+            if data is None:
+                data = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+                    break
+            data[-2] += value
+            data[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, data in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, data):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{_format_labels(self.labelnames + ("le",), labels + (bound,))} {cumulative}')
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames + ("le",), labels + ("+Inf",))} {data[-1]}')
+                label_str = _format_labels(self.labelnames, labels)
+                lines.append(f'{self.name}_sum{label_str} {data[-2]}')
+                lines.append(f'{self.name}_count{label_str} {data[-1]}')
+        return lines
+
+
+class GaugeCollector:
+    # Lê valores atuais (filas, pools, sessões) no momento da coleta; func retorna
+    # um número ou um dict {valor do label: número}
+    def __init__(self, name, help_text, func, labelname=None):
+        self.name = name
+        self.help_text = help_text
+        self.func = func
+        self.labelname = labelname
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge']
+        try:
+            value = self.func()
+        except Exception as e:
+            log_event('gauge_failed', logging.WARNING, gauge=self.name, error=str(e))
+            return lines
+        if isinstance(value, dict):
+            for label, v in value.items():
+                lines.append(f'{self.name}{_format_labels((self.labelname,), (label,))} {v}')
+        else:
+            lines.append(f'{self.name} {value}')
+        return lines
+
+
+REGISTRY = []
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+TURN_DURATION = Histogram('chatbot_turn_duration_seconds', 'Duração de um turno da conversa', ['state'])
+STATE_DURATION = Histogram('chatbot_state_duration_seconds', 'Duração por estado e método', ['state', 'method'])
+TURN_DB_QUERIES = Histogram('chatbot_turn_db_queries', 'Consultas SQL por turno', ['state'],
+                            buckets=(0, 1, 2, 3, 5, 10, 20, 50))
+DB_QUERY_DURATION = Histogram('chatbot_db_query_duration_seconds', 'Duração de cada consulta SQL')
+TWILIO_SEND_DURATION = Histogram('chatbot_twilio_send_duration_seconds', 'Latência de messages.create na Twilio',
+                                 ['status'])
+TURNS = Counter('chatbot_turns_total', 'Turnos processados', ['state'])
+TURN_ERRORS = Counter('chatbot_turn_errors_total', 'Turnos que terminaram em exceção', ['error'])
+INBOUND_LIMITED = Counter('chatbot_inbound_limited_total', 'Mensagens recusadas pelos limites de entrada', ['limit'])
+
+_current = threading.local()
+
+
+@contextmanager
+def turn(phone_number, state_name):
+    # Mede um turno inteiro: duração, consultas SQL e tempo gasto no banco
+    data = {'queries': 0, 'db_time': 0.0, 'spans': {}}
+    _current.turn = data
+    start = time.perf_counter()
+    try:
+        yield data
+    except Exception as e:
+        TURN_ERRORS.inc(type(e).__name__)
+        log_event('turn_failed', logging.ERROR, phone_number=phone_number, state=state_name, error=repr(e))
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _current.turn = None
+        TURN_DURATION.observe(elapsed, state_name)
+        TURN_DB_QUERIES.observe(data['queries'], state_name)
+        TURNS.inc(state_name)
+        log_event('turn', phone_number=phone_number, state=state_name, duration_ms=round(elapsed * 1000, 2),
+                  db_queries=data['queries'], db_ms=round(data['db_time'] * 1000, 2),
+                  spans_ms={name: round(t * 1000, 2) for name, t in data['spans'].items()})
+
+
+@contextmanager
+def span(state_name, method):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STATE_DURATION.observe(elapsed, state_name, method)
+        data = getattr(_current, 'turn', None)
+        if data is not None:
+            key = f'{state_name}.{method}'
+            data['spans'][key] = data['spans'].get(key, 0.0) + elapsed
+
+
+@contextmanager
+def maybe_profile(force=False):
+    # Profiler opcional: PROFILE_SAMPLE_RATE sorteia turnos; force liga para uma requisição específica
+    rate = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+    if not force and not (rate and random.random() < rate):
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profile_dir = os.getenv('PROFILE_DIR', '/tmp/chatbot_profiles')
+        os.makedirs(profile_dir, exist_ok=True)
+        path = os.path.join(profile_dir, f'turn_{time.time():.6f}_{threading.get_ident()}.prof')
+        profiler.dump_stats(path)
+        log_event('profile_saved', path=path)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # O início fica no contexto da execução, não na conexão: uma consulta que falha não deixa
+    # sobra no conn.info da conexão que volta ao pool
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_query_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    DB_QUERY_DURATION.observe(elapsed)
+    data = getattr(_current, 'turn', None)
+    if data is not None:
+        data['queries'] += 1
+        data['db_time'] += elapsed
@@ -0,0 +1,71 @@
+# invalidation.py
+# Invalidação de cache entre processos e máquinas: quem altera dados fora do webhook (importação em
+# massa, sistema de chamados) publica na tabela invalidacoes, e cada worker aplica as novas entradas
+# no máximo a cada CACHE_INVALIDATION_INTERVAL segundos.
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert
+from database import read_session
+from models import Invalidacao
+from instrumentation import log_event
+from tenants import PerTenant
+
+HANDLERS = {}  # tipo -> [handler(chave)]; chave None significa descartar tudo
+
+
+def register(kind, handler):
+    HANDLERS.setdefault(kind, []).append(handler)
+
+
+def publish(session, entries, retention=86400):
+    # entries: [(tipo, chave)]; roda na transação de quem alterou os dados
+    now = datetime.now()
+    if entries:
+        session.execute(insert(Invalidacao), [{'tipo': kind, 'chave': key, 'criado_em': now} for kind, key in entries])
+    session.query(Invalidacao).filter(Invalidacao.criado_em < now - timedelta(seconds=retention)).delete()
+
+
+class InvalidationPoller:
+    def __init__(self, interval=2):
+        self.interval = interval
+        self.last_id = None
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+
+    def poll(self):
+        # Chamado no começo de cada turno; precisa de um app context
+        if time.monotonic() < self._next_poll or not self._lock.acquire(blocking=False):
+            return 0
+        try:
+            self._next_poll = time.monotonic() + self.interval
+            if self.last_id is None:
+                # Processo novo: os caches estão vazios, então só interessa o que vier depois
+                self.last_id = read_session.query(func.max(Invalidacao.id)).scalar() or 0
+                return 0
+            rows = read_session.query(Invalidacao.id, Invalidacao.tipo, Invalidacao.chave).filter(
+                Invalidacao.id > self.last_id
+            ).order_by(Invalidacao.id).limit(10000).all()
+            for row in rows:
+                handlers = HANDLERS.get(row.tipo)
+                if not handlers:
+                    log_event('invalidation_unknown', logging.WARNING, kind=row.tipo)
+                    continue
+                for handler in handlers:
+                    handler(row.chave)
+            if rows:
+                self.last_id = rows[-1].id
+            return len(rows)
+        except Exception as e:
+            # Melhor esforço: sem a tabela (ou com o banco instável) o turno segue com os caches como estão
+            read_session.rollback()
+            log_event('invalidation_poll_failed', logging.WARNING, error=str(e))
+            return 0
+        finally:
+            self._lock.release()
+
+
+# Cada tenant lê a tabela invalidacoes do próprio banco
+poller = PerTenant(lambda: InvalidationPoller(float(os.getenv('CACHE_INVALIDATION_INTERVAL', '2'))))
@@ -0,0 +1,179 @@
+# matchers.py
+import re
+import unicodedata
+
+TOKEN_PATTERN = re.compile(r'\w+')
+_NO_VALUE = object()
+
+
+def normalize(message):
+    # Minúsculas, sem acentos e com espaços colapsados: 'Olá,  Tudo Bem?' -> 'ola, tudo bem?'
+    text = message.strip().casefold()
+    if not text.isascii():
+        text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return ' '.join(text.split())
+
+
+def tokenize(text):
+    # Só letras e números; pontuação é ignorada ('oi!' -> ['oi'])
+    return TOKEN_PATTERN.findall(text)
+
+
+def within_distance(a, b, max_distance):
+    # Levenshtein com transposição de vizinhos, limitado a uma faixa em torno da diagonal;
+    # para assim que a distância passa do limite
+    if abs(len(a) - len(b)) > max_distance:
+        return False
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [max_distance + 1] * len(b)
+        for j in range(max(1, i - max_distance), min(len(b), i + max_distance) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return False
+        previous2, previous = previous, current
+    return previous[len(b)] <= max_distance
+
+
+class KeywordIndex:
+    # Trie de tokens: cada frase é um caminho de palavras normalizadas até o valor associado.
+    # Palavras com pelo menos min_typo_length letras aceitam até max_typos erros de digitação.
+    def __init__(self, max_typos=1, min_typo_length=4):
+        self.max_typos = max_typos
+        self.min_typo_length = min_typo_length
+        self._root = ({}, _NO_VALUE)
+        self._symbols = {}  # frases sem letras nem números, como '>' e '<'
+
+    def add(self, phrase, value):
+        text = normalize(phrase)
+        tokens = tokenize(text)
+        if not tokens:
+            self._symbols[text] = value
+            return
+        node, parent, key = self._root, None, None
+        for token in tokens:
+            children = node[0]
+            if token not in children:
+                children[token] = ({}, _NO_VALUE)
+            node, parent, key = children[token], children, token
+        parent[key] = (node[0], value)
+
+    def _child(self, children, token):
+        child = children.get(token)
+        if child is not None or not self.max_typos or len(token) < self.min_typo_length:
+            return child
+        for key, candidate in children.items():
+            if len(key) >= self.min_typo_length and within_distance(token, key, self.max_typos):
+                return candidate
+        return None
+
+    def lookup(self, text, prefix=False):
+        # prefix=True aceita frases no começo da mensagem ('bom dia, preciso de ajuda')
+        tokens = tokenize(text)
+        if not tokens:
+            return self._symbols.get(text)
+        node = self._root
+        found = None
+        for token in tokens:
+            node = self._child(node[0], token)
+            if node is None:
+                return found
+            if prefix and node[1] is not _NO_VALUE:
+                found = node[1]
+        if node[1] is _NO_VALUE:
+            return found
+        return node[1]
+
+    def phrases(self, node=None, path=()):
+        node = node or self._root
+        if node[1] is not _NO_VALUE:
+            yield ' '.join(path)
+        for token, child in node[0].items():
+            yield from self.phrases(child, path + (token,))
+
+
+class Keywords:
+    # Casa quando a mensagem normalizada é uma das frases, tolerando acentos, pontuação e erros pequenos
+    def __init__(self, *phrases, prefix=False, max_typos=1):
+        self.prefix = prefix
+        self.index = KeywordIndex(max_typos=max_typos)
+        for phrase in phrases:
+            self.index.add(phrase, normalize(phrase))
+
+    def match(self, message, text):
+        return self.index.lookup(text, self.prefix)
+
+    def __repr__(self):
+        return f'Keywords({", ".join(sorted(self.index.phrases()) + sorted(self.index._symbols))})'
+
+
+class Choice:
+    # Mapeia a resposta para um valor (ex.: '1' -> 'pdf'); default vale só para a mensagem vazia
+    def __init__(self, choices, default=None, max_typos=1):
+        self.index = KeywordIndex(max_typos=max_typos)
+        for key, value in choices.items():
+            self.index.add(key, value)
+        self.default = default
+
+    def match(self, message, text):
+        if not text:
+            return self.default
+        return self.index.lookup(text)
+
+    def __repr__(self):
+        return f'Choice({", ".join(sorted(self.index.phrases()))})'
+
+
+class Command:
+    # Comando seguido de um termo livre: 'buscar impressora' -> 'impressora'. Sem termo, não casa.
+    def __init__(self, *commands, max_typos=1):
+        self.index = KeywordIndex(max_typos=max_typos)
+        for command in commands:
+            self.index.add(command, True)
+
+    def match(self, message, text):
+        command, _, term = text.partition(' ')
+        if not term or self.index.lookup(command) is None:
+            return None
+        return term
+
+    def __repr__(self):
+        return f'Command({", ".join(sorted(self.index.phrases()))})'
+
+
+class Number:
+    # Números de chamado: '12', '#12', '12.'
+    PATTERN = re.compile(r'#?\s*(\d{1,9})\.?')
+
+    def match(self, message, text):
+        found = self.PATTERN.fullmatch(text)
+        return int(found.group(1)) if found else None
+
+    def __repr__(self):
+        return 'Number()'
+
+
+class Pattern:
+    # Pré-filtro por expressão regular sobre o texto original, antes de qualquer consulta
+    def __init__(self, pattern):
+        self.regex = re.compile(pattern)
+
+    def match(self, message, text):
+        message = message.strip()
+        return message if self.regex.fullmatch(message) else None
+
+    def __repr__(self):
+        return f'Pattern({self.regex.pattern})'
+
+
+class Anything:
+    # Casa qualquer mensagem e entrega o texto original, sem normalizar
+    def match(self, message, text):
+        return message.strip()
+
+    def __repr__(self):
+        return 'Anything()'
@@ -0,0 +1,81 @@
+# message_packing.py
+import math
+import os
+
+# Alfabeto GSM-7 padrão (1 septeto) e tabela de extensão (2 septetos, com escape)
+GSM7_BASIC = set(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM7_EXTENDED = set("^{}\\[~]|€\f")
+
+MAX_BODY_LENGTH = int(os.getenv('MESSAGE_MAX_LENGTH', '1600'))  # Limite do corpo de mensagem da Twilio
+MAX_SEGMENTS = int(os.getenv('SMS_MAX_SEGMENTS', '10'))
+SEPARATOR = '\n\n'
+
+
+def is_gsm7(text):
+    return all(c in GSM7_BASIC or c in GSM7_EXTENDED for c in text)
+
+
+def segment_count(text):
+    # Acentos como "ã" e "ç" não existem no GSM-7 e forçam UCS-2 (70/67 caracteres por segmento)
+    if is_gsm7(text):
+        length = sum(2 if c in GSM7_EXTENDED else 1 for c in text)
+        single, multi = 160, 153
+    else:
+        length = len(text.encode('utf-16-le')) // 2
+        single, multi = 70, 67
+    if length <= single:
+        return 1
+    return math.ceil(length / multi)
+
+
+def _fits(text, whatsapp):
+    if len(text) > MAX_BODY_LENGTH:
+        return False
+    return whatsapp or segment_count(text) <= MAX_SEGMENTS
+
+
+def _split(text, whatsapp):
+    # Quebra mensagens grandes (ex.: lista de chamados) em fronteiras de linha
+    chunks = []
+    current = ''
+    for line in text.split('\n'):
+        candidate = f'{current}\n{line}' if current else line
+        if _fits(candidate, whatsapp):
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        # Uma única linha grande demais é cortada por caracteres
+        while not _fits(line, whatsapp):
+            low, high = 1, len(line)
+            while low < high:  # Busca binária pelo maior prefixo que cabe
+                mid = (low + high + 1) // 2
+                if _fits(line[:mid], whatsapp):
+                    low = mid
+                else:
+                    high = mid - 1
+            chunks.append(line[:low])
+            line = line[low:]
+        current = line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def pack_messages(messages, whatsapp=False):
+    # Junta fragmentos consecutivos no menor número de mensagens possível
+    packed = []
+    for message in messages:
+        for chunk in _split(message, whatsapp):
+            if packed:
+                merged = packed[-1] + SEPARATOR + chunk
+                # No SMS só junta se não aumentar o número de segmentos cobrados
+                cheaper = whatsapp or segment_count(merged) <= segment_count(packed[-1]) + segment_count(chunk)
+                if cheaper and _fits(merged, whatsapp):
+                    packed[-1] = merged
+                    continue
+            packed.append(chunk)
+    return packed
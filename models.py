@@ -8,9 +8,65 @@ class Contrato(db.Model):
 
 class Chamado(db.Model):
     __tablename__ = 'chamados'
+    __table_args__ = (
+        # Listagem paginada por contrato em ordem de data_chamado (ver GetCallsState.get_calls)
+        db.Index('ix_chamados_contrato_data', 'contrato_id', 'data_chamado'),
+        # Varredura incremental de alterações por marca d'água (ver notifications.ChangeDetector)
+        db.Index('ix_chamados_data_atualizacao', 'data_atualizacao', 'id'),
+        # Atualização incremental do índice de busca de cada contrato (ver ticket_search.py)
+        db.Index('ix_chamados_contrato_atualizacao', 'contrato_id', 'data_atualizacao'),
+        # Busca por palavra no MySQL (SEARCH_BACKEND=fulltext); nos outros bancos o índice é em memória
+        db.Index('ix_chamados_busca', 'descricao', 'ultima_atualizacao', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     contrato_id = db.Column(db.Integer, db.ForeignKey('contratos.id'), nullable=False)
     descricao = db.Column(db.String(255), nullable=False)
     data_chamado = db.Column(db.DateTime, nullable=False)
     data_atualizacao = db.Column(db.DateTime, nullable=False)
     ultima_atualizacao = db.Column(db.String(255), nullable=False)
+
+class ResumoContrato(db.Model):
+    # Resumo por contrato mantido por contract_summary.py: o menu lê uma linha pela chave primária
+    # em vez de contar e ordenar os chamados a cada visita
+    __tablename__ = 'resumo_contratos'
+    contrato_id = db.Column(db.Integer, db.ForeignKey('contratos.id'), primary_key=True)
+    total_chamados = db.Column(db.Integer, nullable=False)
+    data_ultimo_chamado = db.Column(db.DateTime)
+    data_ultima_atualizacao = db.Column(db.DateTime)
+    atualizado_em = db.Column(db.DateTime, nullable=False)
+
+class Inscricao(db.Model):
+    # Telefones que consultaram um chamado e recebem aviso quando ele for atualizado
+    __tablename__ = 'inscricoes'
+    __table_args__ = (
+        db.UniqueConstraint('telefone', 'chamado_id', name='uq_inscricoes_telefone_chamado'),
+        db.Index('ix_inscricoes_chamado', 'chamado_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    telefone = db.Column(db.String(64), nullable=False)
+    numero_twilio = db.Column(db.String(64))
+    chamado_id = db.Column(db.Integer, db.ForeignKey('chamados.id'), nullable=False)
+    criado_em = db.Column(db.DateTime, nullable=False)
+
+class Invalidacao(db.Model):
+    # Invalidações de cache publicadas por outros processos (ex.: import_data.py); ver invalidation.py
+    __tablename__ = 'invalidacoes'
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(32), nullable=False)
+    chave = db.Column(db.String(255))  # None invalida o cache inteiro
+    criado_em = db.Column(db.DateTime, nullable=False, index=True)
+
+class Transcricao(db.Model):
+    # Registro das conversas, gravado em lotes por transcript.py (TRANSCRIPT_SINK=db)
+    __tablename__ = 'transcricoes'
+    __table_args__ = (
+        db.Index('ix_transcricoes_telefone_criado_em', 'telefone', 'criado_em'),
+    )
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    criado_em = db.Column(db.DateTime, nullable=False, index=True)
+    telefone = db.Column(db.String(64), nullable=False)
+    numero_twilio = db.Column(db.String(64))
+    direcao = db.Column(db.String(3), nullable=False)  # 'in' (recebida) ou 'out' (enviada)
+    estado_anterior = db.Column(db.String(64))
+    estado_novo = db.Column(db.String(64))
+    mensagem = db.Column(db.Text, nullable=False)
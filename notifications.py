@@ -0,0 +1,251 @@
+# notifications.py
+# Avisa por SMS/WhatsApp quem consultou um chamado quando ele for atualizado, em vez de esperar
+# o cliente voltar ao menu para conferir. Roda como processo separado:
+#
+#   python notifications.py
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import and_, insert, or_, update
+from sqlalchemy.exc import IntegrityError
+from cache import TTLCache
+from database import db, read_session, get_app
+from models import Chamado, Inscricao
+from twilio_helpers import send_auto_messages
+from worker_pool import QueueFullError
+from tenants import current_tenant, registry as tenants, use_tenant
+from instrumentation import log_event, logger, setup_logging
+
+NOTIFY_SUBSCRIBE = os.getenv('NOTIFY_SUBSCRIBE', '1') == '1'
+NOTIFY_SUBSCRIPTION_DAYS = int(os.getenv('NOTIFY_SUBSCRIPTION_DAYS', '30'))
+
+_recent_subscriptions = TTLCache(max_size=int(os.getenv('NOTIFY_SUBSCRIPTION_CACHE_SIZE', '50000')), ttl=3600)
+
+
+class SubscriptionBuffer:
+    # Acumula as inscrições feitas durante os turnos e grava tudo numa única transação periódica,
+    # para que o turno não precise de uma segunda conexão só para escrever
+    def __init__(self, flush_interval=5, max_pending=10000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}  # (tenant, telefone, chamado) -> (número twilio, contrato, criado_em)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, tenant_name, phone_number, my_twilio_number, call_id, contract_id):
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                log_event('subscription_dropped', logging.WARNING, phone_number=phone_number, call_id=call_id)
+                return
+            self._pending[(tenant_name, phone_number, call_id)] = (my_twilio_number, contract_id, datetime.now())
+            if self._thread is None:
+                # Criado sob demanda para não iniciar a thread antes do fork do gunicorn
+                self._thread = threading.Thread(target=self._run, name='subscription-flush', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('subscription_flush_failed')
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        by_tenant = defaultdict(dict)
+        for (tenant_name, phone_number, call_id), value in pending.items():
+            by_tenant[tenant_name][(phone_number, call_id)] = value
+        written = 0
+        for tenant_name, tenant_pending in by_tenant.items():
+            # Um app context por tenant para não misturar o identity map de bancos diferentes
+            with get_app().app_context(), use_tenant(tenants.get(tenant_name)):
+                written += self._write(tenant_pending)
+        return written
+
+    def _write(self, pending):
+        for attempt in range(2):
+            try:
+                return write_subscriptions(pending)
+            except IntegrityError:
+                # Outro processo inscreveu o mesmo telefone no meio do caminho: relê e tenta de novo
+                db.session.rollback()
+        return 0
+
+
+def write_subscriptions(pending):
+    call_ids = {call_id for _, call_id in pending}
+    phone_numbers = {phone_number for phone_number, _ in pending}
+    # Só inscreve no chamado se ele ainda for do contrato que o cliente verificou
+    valid = set(db.session.query(Chamado.id, Chamado.contrato_id).filter(Chamado.id.in_(call_ids)))
+    existing = {
+        (telefone, chamado_id): subscription_id
+        for subscription_id, telefone, chamado_id in db.session.query(
+            Inscricao.id, Inscricao.telefone, Inscricao.chamado_id
+        ).filter(Inscricao.telefone.in_(phone_numbers), Inscricao.chamado_id.in_(call_ids))
+    }
+    updates, inserts = [], []
+    for (phone_number, call_id), (my_twilio_number, contract_id, criado_em) in pending.items():
+        if (call_id, contract_id) not in valid:
+            continue
+        subscription_id = existing.get((phone_number, call_id))
+        if subscription_id is None:
+            inserts.append({'telefone': phone_number, 'numero_twilio': my_twilio_number,
+                            'chamado_id': call_id, 'criado_em': criado_em})
+        else:
+            updates.append({'id': subscription_id, 'numero_twilio': my_twilio_number, 'criado_em': criado_em})
+    if updates:
+        db.session.execute(update(Inscricao), updates)
+    if inserts:
+        db.session.execute(insert(Inscricao), inserts)
+    db.session.commit()
+    return len(updates) + len(inserts)
+
+
+subscriptions = SubscriptionBuffer(
+    flush_interval=float(os.getenv('NOTIFY_SUBSCRIBE_FLUSH_INTERVAL', '5')),
+    max_pending=int(os.getenv('NOTIFY_SUBSCRIBE_MAX_PENDING', '10000')),
+)
+
+
+def subscribe(phone_number, my_twilio_number, call_id, contract_id):
+    # Chamado no turno em que o cliente consulta um chamado; o cache evita regravar a cada consulta
+    tenant_name = current_tenant().name
+    key = (tenant_name, phone_number, call_id)
+    if not NOTIFY_SUBSCRIBE or _recent_subscriptions.get(key):
+        return
+    _recent_subscriptions.set(key, True)
+    subscriptions.add(tenant_name, phone_number, my_twilio_number, call_id, contract_id)
+
+
+def format_notification(chamado):
+    return (f"O chamado {chamado.id} ({chamado.descricao}) foi atualizado em "
+            f"{chamado.data_atualizacao.strftime('%d-%m-%y %H:%M')}:\n{chamado.ultima_atualizacao}")
+
+
+class ChangeDetector:
+    # Lê os chamados alterados depois da marca d'água (data_atualizacao, id), em lotes pelo índice
+    # ix_chamados_data_atualizacao, e envia um aviso agrupado por telefone inscrito.
+    def __init__(self, state_path, batch_size=500, lookback=60, send=send_auto_messages, tenant=None):
+        self.state_path = state_path
+        self.tenant = tenant  # Cada tenant tem o próprio banco e a própria marca d'água
+        self.batch_size = batch_size
+        self.lookback = timedelta(seconds=lookback)
+        self.send = send
+        self.mark = self._load_mark()
+        # ((chamado, data_atualizacao), destinatário) já avisados; a janela de lookback relê
+        # alguns chamados de propósito
+        self._notified = TTLCache(max_size=100000, ttl=max(lookback * 10, 600))
+
+    def _load_mark(self):
+        try:
+            with open(self.state_path) as f:
+                data = json.load(f)
+            return datetime.fromisoformat(data['data_atualizacao']), data['id']
+        except FileNotFoundError:
+            # Primeira execução: só avisa o que mudar daqui para frente
+            return datetime.now(), 0
+
+    def _save_mark(self):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'data_atualizacao': self.mark[0].isoformat(), 'id': self.mark[1]}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def fetch_changes(self, after):
+        data_atualizacao, call_id = after
+        return read_session.query(
+            Chamado.id, Chamado.descricao, Chamado.data_atualizacao, Chamado.ultima_atualizacao
+        ).filter(or_(
+            Chamado.data_atualizacao > data_atualizacao,
+            and_(Chamado.data_atualizacao == data_atualizacao, Chamado.id > call_id),
+        )).order_by(Chamado.data_atualizacao.asc(), Chamado.id.asc()).limit(self.batch_size).all()
+
+    def fetch_subscribers(self, call_ids):
+        since = datetime.now() - timedelta(days=NOTIFY_SUBSCRIPTION_DAYS)
+        rows = read_session.query(Inscricao.chamado_id, Inscricao.telefone, Inscricao.numero_twilio).filter(
+            Inscricao.chamado_id.in_(call_ids), Inscricao.criado_em >= since
+        ).all()
+        subscribers = defaultdict(list)
+        for call_id, phone_number, my_twilio_number in rows:
+            subscribers[call_id].append((phone_number, my_twilio_number))
+        return subscribers
+
+    def run_once(self):
+        # Um ciclo completo; retorna quantos avisos foram enviados
+        sent = 0
+        # Começa um pouco antes da marca para pegar transações que gravaram uma data_atualizacao antiga
+        cursor = (self.mark[0] - self.lookback, 0)
+        while True:
+            changes = self.fetch_changes(cursor)
+            if not changes:
+                break
+            subscribers = self.fetch_subscribers([chamado.id for chamado in changes])
+            outbox = defaultdict(list)  # (telefone, número twilio) -> [((chamado, data_atualizacao), aviso)]
+            for chamado in changes:
+                key = (chamado.id, chamado.data_atualizacao)
+                for recipient in subscribers.get(chamado.id, ()):
+                    if not self._notified.get((key, recipient)):
+                        outbox[recipient].append((key, format_notification(chamado)))
+            try:
+                for recipient, entries in outbox.items():
+                    phone_number, my_twilio_number = recipient
+                    self.send(phone_number, [message for _, message in entries], my_twilio_number)
+                    sent += len(entries)
+                    # Marca por destinatário: se a fila encher no meio do lote, quem já recebeu não recebe de novo
+                    for key, _ in entries:
+                        self._notified.set((key, recipient), True)
+            except QueueFullError:
+                # O dispatcher está sobrecarregado: tenta o restante no próximo ciclo
+                log_event('notify_backpressure', logging.WARNING, pending=len(outbox))
+                break
+            last = changes[-1]
+            cursor = (last.data_atualizacao, last.id)
+            if cursor > self.mark:
+                self.mark = cursor
+                self._save_mark()
+            if len(changes) < self.batch_size:
+                break
+        return sent
+
+    def run_forever(self, interval):
+        while True:
+            start = time.monotonic()
+            try:
+                with get_app().app_context(), use_tenant(self.tenant):
+                    sent = self.run_once()
+                if sent:
+                    log_event('notifications_sent', count=sent, mark=self.mark[0].isoformat(),
+                              tenant=self.tenant.name if self.tenant else None)
+            except Exception:
+                logger.exception('notify_failed')
+            time.sleep(max(0.0, interval - (time.monotonic() - start)))
+
+
+if __name__ == '__main__':
+    setup_logging()
+    state_path = os.getenv('NOTIFY_STATE_PATH', '/tmp/chatbot_notify_mark.json')
+    interval = float(os.getenv('NOTIFY_INTERVAL', '30'))
+    threads = []
+    # Um detector por tenant, cada um com a marca d'água num arquivo próprio
+    for tenant in tenants.tenants.values():
+        if not tenant.is_default and tenant.database_url is None:
+            continue  # Usa o banco do tenant padrão, que já tem o seu detector
+        detector = ChangeDetector(
+            state_path if tenant.is_default else f'{os.path.splitext(state_path)[0]}.{tenant.name}.json',
+            batch_size=int(os.getenv('NOTIFY_BATCH_SIZE', '500')),
+            lookback=int(os.getenv('NOTIFY_LOOKBACK', '60')),
+            tenant=tenant,
+        )
+        thread = threading.Thread(target=detector.run_forever, args=(interval,), name=f'notify-{tenant.name}')
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
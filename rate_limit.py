@@ -0,0 +1,39 @@
+# rate_limit.py
+import threading
+import time
+
+
+class TokenBucket:
+    # Balde de fichas: permite rajadas de até `burst` e depois `rate` fichas por segundo
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self):
+        # Retorna 0 se conseguiu a ficha, ou quantos segundos faltam para a próxima
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def release(self):
+        # Devolve uma ficha tirada para uma operação que acabou não acontecendo
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+    def acquire(self):
+        # Bloqueia até conseguir uma ficha
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
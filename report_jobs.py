@@ -0,0 +1,118 @@
+# report_jobs.py
+import logging
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger('chatbot.report_jobs')
+
+
+class JobQueueFullError(Exception):
+    pass
+
+
+class ReportJobManager:
+    # Roda a geração de relatórios num pool de processos, fora do GIL dos workers do webhook.
+    # Pedidos idênticos (mesma chave) já em andamento reaproveitam o mesmo job.
+    def __init__(self, max_workers=2, max_pending=100, job_ttl=3600, start_method='spawn', initializer=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self.start_method = start_method
+        self.initializer = initializer
+        self._executor = None
+        self._jobs = {}  # job_id -> dados do job
+        self._in_flight = {}  # chave -> job_id
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Criado sob demanda para não iniciar processos antes do fork do gunicorn
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=self.initializer,
+            )
+        return self._executor
+
+    def submit(self, key, func, args, on_done=None):
+        # on_done(job) é chamado numa thread do processo principal quando o job termina
+        with self._lock:
+            self._prune()
+            job_id = self._in_flight.get(key)
+            if job_id is not None:
+                if on_done:
+                    self._jobs[job_id]['callbacks'].append(on_done)
+                return job_id
+            if len(self._in_flight) >= self.max_pending:
+                raise JobQueueFullError(f"Fila de relatórios cheia ({len(self._in_flight)} jobs)")
+
+            job_id = uuid.uuid4().hex
+            job = {
+                'id': job_id,
+                'key': key,
+                'status': 'queued',
+                'result': None,
+                'error': None,
+                'created_at': time.time(),
+                'finished_at': None,
+                'callbacks': [on_done] if on_done else [],
+            }
+            self._jobs[job_id] = job
+            self._in_flight[key] = job_id
+            future = self._get_executor().submit(func, *args)
+            job['future'] = future
+        future.add_done_callback(lambda f: self._finish(job_id, f))
+        return job_id
+
+    def _finish(self, job_id, future):
+        with self._lock:
+            job = self._jobs[job_id]
+            try:
+                job['result'] = future.result()
+                job['status'] = 'done'
+            except Exception as e:
+                job['error'] = str(e)
+                job['status'] = 'failed'
+            job['finished_at'] = time.time()
+            self._in_flight.pop(job['key'], None)
+            callbacks, job['callbacks'] = job['callbacks'], []
+            job.pop('future', None)
+        for callback in callbacks:
+            try:
+                callback(job)
+            except Exception:
+                logger.exception("Report job callback failed", extra={'fields': {'job_id': job_id}})
+
+    def _prune(self):
+        # Esquece jobs terminados há mais de job_ttl segundos
+        limit = time.time() - self.job_ttl
+        for job_id in [j for j, job in self._jobs.items() if job['finished_at'] and job['finished_at'] < limit]:
+            del self._jobs[job_id]
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            status = job['status']
+            if status == 'queued' and job.get('future') is not None and job['future'].running():
+                status = 'running'
+            return {
+                'id': job['id'],
+                'status': status,
+                'result': job['result'],
+                'error': job['error'],
+                'created_at': job['created_at'],
+                'finished_at': job['finished_at'],
+            }
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': len(self._in_flight), 'tracked': len(self._jobs)}
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
@@ -0,0 +1,167 @@
+# reports.py
+import atexit
+import csv
+import io
+import os
+import threading
+from sqlalchemy import func
+from database import db, read_session, get_app
+from models import Chamado
+import artifacts
+from report_jobs import ReportJobManager
+from twilio_helpers import send_auto_messages
+from tenants import current_tenant, registry as tenants, use_tenant
+
+REPORT_CHUNK_SIZE = int(os.getenv('REPORT_CHUNK_SIZE', '1000'))
+HEADERS = ['ID Chamado', 'Descrição', 'Data Chamado', 'Data Atualização', 'Última Atualização']
+
+
+def report_version(contract_id):
+    # Uma única consulta agregada identifica a versão atual dos chamados do contrato
+    return read_session.query(func.count(Chamado.id), func.max(Chamado.data_atualizacao)).filter(
+        Chamado.contrato_id == contract_id
+    ).one()
+
+
+def stream_calls(contract_id):
+    # Lê os chamados em blocos, como tuplas, sem montar objetos do ORM nem um DataFrame
+    query = read_session.query(
+        Chamado.id, Chamado.descricao, Chamado.data_chamado, Chamado.data_atualizacao, Chamado.ultima_atualizacao
+    ).filter(Chamado.contrato_id == contract_id).order_by(Chamado.data_chamado.desc(), Chamado.id.desc())
+    for call_id, descricao, data_chamado, data_atualizacao, ultima_atualizacao in query.yield_per(REPORT_CHUNK_SIZE):
+        yield [call_id, descricao, data_chamado.strftime('%Y-%m-%d'), data_atualizacao.strftime('%Y-%m-%d'),
+               ultima_atualizacao]
+
+
+def render_pdf(rows, f):
+    from reportlab.lib.pagesizes import letter, landscape
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.pdfgen import canvas
+
+    font, font_size, line_height = 'Helvetica', 9, 14
+    width, height = landscape(letter)
+    columns = [40, 100, 400, 480, 560]  # Posição x de cada coluna
+    limits = [c2 - c1 - 6 for c1, c2 in zip(columns, columns[1:] + [width - 30])]
+
+    def fit(text, limit):
+        text = str(text)
+        if stringWidth(text, font, font_size) <= limit:
+            return text
+        while text and stringWidth(text + '...', font, font_size) > limit:
+            text = text[:-1]
+        return text + '...'
+
+    p = canvas.Canvas(f, pagesize=(width, height))
+
+    def start_page(page):
+        p.setFont('Helvetica-Bold', 12)
+        p.drawString(columns[0], height - 40, f"Relatório de Chamados - página {page}")
+        p.setFont('Helvetica-Bold', font_size)
+        for x, header in zip(columns, HEADERS):
+            p.drawString(x, height - 70, header)
+        p.setFont(font, font_size)
+        return height - 70 - line_height
+
+    page = 1
+    y = start_page(page)
+    for row in rows:
+        if y < 40:
+            # Quebra de página em vez de deixar as linhas saírem da folha
+            p.showPage()
+            page += 1
+            y = start_page(page)
+        for x, limit, value in zip(columns, limits, row):
+            p.drawString(x, y, fit(value, limit))
+        y -= line_height
+    p.save()
+
+
+def render_csv(rows, f):
+    text = io.TextIOWrapper(f, encoding='utf-8-sig', newline='')  # BOM para o Excel reconhecer os acentos
+    writer = csv.writer(text)
+    writer.writerow(HEADERS)
+    writer.writerows(rows)
+    text.flush()
+    text.detach()
+
+
+def render_xlsx(rows, f):
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)  # Modo streaming: as linhas não ficam todas na memória
+    sheet = workbook.create_sheet('Chamados')
+    sheet.append(HEADERS)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(f)
+
+
+RENDERERS = {'pdf': render_pdf, 'csv': render_csv, 'xlsx': render_xlsx}
+
+
+def report_name(contract_id, fmt='pdf'):
+    # Retorna o nome do relatório no artifact store, ou None se o contrato não tem chamados.
+    # O nome depende do contrato e de max(data_atualizacao), então um contrato
+    # sem mudanças reaproveita o arquivo já gerado.
+    count, last_update = report_version(contract_id)
+    if not count:
+        return None
+    tenant = current_tenant()
+    # Ids de contrato se repetem entre os bancos dos tenants
+    prefix = 'report' if tenant.is_default else f'report:{tenant.name}'
+    return artifacts.artifact_name(f'{prefix}:{contract_id}:{count}:{last_update.isoformat()}', fmt)
+
+
+def generate_report(contract_id, fmt='pdf'):
+    # Retorna o nome do relatório, ou None se o contrato não tem chamados
+    name = report_name(contract_id, fmt)
+    if name is None or artifacts.exists(name):
+        return name
+    with artifacts.atomic_write(name) as f:
+        RENDERERS[fmt](stream_calls(contract_id), f)
+    return name
+
+
+def init_report_worker():
+    # Num processo criado por fork, as conexões herdadas do pai não podem ser reutilizadas
+    with get_app().app_context():
+        db.engine.dispose(close=False)
+
+
+def build_report(contract_id, fmt, tenant_name=None):
+    # Ponto de entrada no processo do pool
+    with get_app().app_context(), use_tenant(tenants.get(tenant_name)):
+        return generate_report(contract_id, fmt)
+
+
+_report_jobs = None
+_report_jobs_lock = threading.Lock()
+
+
+def get_report_jobs():
+    global _report_jobs
+    with _report_jobs_lock:
+        if _report_jobs is None:
+            _report_jobs = ReportJobManager(
+                max_workers=int(os.getenv('REPORT_WORKERS', '2')),
+                max_pending=int(os.getenv('REPORT_MAX_PENDING', '100')),
+                start_method=os.getenv('REPORT_START_METHOD', 'spawn'),
+                initializer=init_report_worker,
+            )
+            atexit.register(_report_jobs.shutdown)
+        return _report_jobs
+
+
+def submit_report(contract_id, fmt, to_number, my_twilio_number):
+    # Enfileira o relatório; o link é enviado por mensagem quando o job termina
+    def notify(job):
+        if job['status'] == 'failed':
+            message = "Não foi possível gerar o relatório. Por favor, tente novamente mais tarde."
+        elif job['result'] is None:
+            message = "Não há chamados registrados para este contrato."
+        else:
+            message = f"Relatório gerado com sucesso! Baixe aqui: {artifacts.signed_url(job['result'])}"
+        send_auto_messages(to_number, [message], my_twilio_number)
+
+    tenant_name = current_tenant().name
+    return get_report_jobs().submit((tenant_name, contract_id, fmt), build_report, (contract_id, fmt, tenant_name),
+                                    on_done=notify)
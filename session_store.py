@@ -0,0 +1,83 @@
+# session_store.py
+import json
+import os
+import time
+from cache import TTLCache
+from database import SQLiteConnections
+from context import ConversationContext
+
+
+class MemorySessionStore:
+    # Guarda os contextos no próprio processo, com limite de tamanho (LRU) e expiração (TTL)
+    def __init__(self, max_size=10000, ttl=1800):
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+
+    def get(self, phone_number):
+        return self._cache.get(phone_number)
+
+    def set(self, phone_number, context):
+        self._cache.set(phone_number, context)
+
+    def delete(self, phone_number):
+        self._cache.delete(phone_number)
+
+    def __contains__(self, phone_number):
+        return self.get(phone_number) is not None
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class SQLiteSessionStore:
+    # Salva apenas o estado compacto da conversa num arquivo SQLite compartilhado entre workers
+    def __init__(self, path, ttl=1800):
+        self.path = path
+        self.ttl = ttl
+        self._connections = SQLiteConnections(path)
+        self._connections.get().execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'phone_number TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+        self._connections.get().execute('CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)')
+
+    def get(self, phone_number):
+        row = self._connections.get().execute(
+            'SELECT data FROM sessions WHERE phone_number = ? AND expires_at >= ?',
+            (phone_number, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        return ConversationContext.from_dict(json.loads(row[0]))
+
+    def set(self, phone_number, context):
+        now = time.time()
+        conn = self._connections.get()
+        conn.execute(
+            'INSERT OR REPLACE INTO sessions (phone_number, data, expires_at) VALUES (?, ?, ?)',
+            (phone_number, json.dumps(context.to_dict()), now + self.ttl)
+        )
+        conn.execute('DELETE FROM sessions WHERE expires_at < ?', (now,))
+
+    def delete(self, phone_number):
+        self._connections.get().execute('DELETE FROM sessions WHERE phone_number = ?', (phone_number,))
+
+    def __contains__(self, phone_number):
+        return self.get(phone_number) is not None
+
+    def __len__(self):
+        return self._connections.get().execute(
+            'SELECT COUNT(*) FROM sessions WHERE expires_at >= ?', (time.time(),)
+        ).fetchone()[0]
+
+
+def create_session_store():
+    # Escolhe o backend pelas variáveis de ambiente (SESSION_STORE=memory|sqlite)
+    backend = os.getenv('SESSION_STORE', 'memory')
+    ttl = int(os.getenv('SESSION_TTL', '1800'))
+    if backend == 'sqlite':
+        path = os.getenv('SESSION_SQLITE_PATH', '/tmp/chatbot_sessions.db')
+        return SQLiteSessionStore(path, ttl=ttl)
+    if backend == 'memory':
+        max_size = int(os.getenv('SESSION_MAX_SIZE', '10000'))
+        return MemorySessionStore(max_size=max_size, ttl=ttl)
+    raise ValueError(f"SESSION_STORE desconhecido: {backend}")
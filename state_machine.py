@@ -0,0 +1,92 @@
+# state_machine.py
+from instrumentation import span
+from matchers import normalize
+
+
+class StateMachineError(Exception):
+    pass
+
+
+class Transition:
+    # action(context, valor) retorna as mensagens da transição, ou None para recusar
+    # (a próxima transição da lista é tentada). target=None mantém o estado atual.
+    def __init__(self, matcher, target=None, reply=(), action=None):
+        self.matcher = matcher
+        self.target = target
+        self.reply = list(reply)
+        self.action = action
+
+
+class StateSpec:
+    # on_enter(context) roda exatamente uma vez a cada entrada no estado;
+    # redirect leva direto a outro estado (estados de passagem, que não esperam mensagem)
+    def __init__(self, name, transitions=(), on_enter=None, redirect=None):
+        self.name = name
+        self.transitions = list(transitions)
+        self.on_enter = on_enter
+        self.redirect = redirect
+
+
+class StateMachine:
+    def __init__(self, initial, states):
+        self.initial = initial
+        self.states = {state.name: state for state in states}
+        self._validate()
+
+    def _validate(self):
+        # Erros na tabela aparecem na importação, e não no meio de uma conversa
+        if self.initial not in self.states:
+            raise StateMachineError(f"Estado inicial desconhecido: {self.initial}")
+        for name, targets in self.graph().items():
+            for target in targets:
+                if target not in self.states:
+                    raise StateMachineError(f"{name} aponta para um estado desconhecido: {target}")
+
+    def graph(self):
+        # Estado -> estados alcançáveis a partir dele, para inspeção e documentação
+        graph = {}
+        for state in self.states.values():
+            targets = {t.target for t in state.transitions if t.target is not None}
+            if state.redirect is not None:
+                targets.add(state.redirect)
+            graph[state.name] = sorted(targets)
+        return graph
+
+    def handle(self, context, message):
+        state = self.states.get(context.state)
+        if state is None:
+            # Sessão salva com um estado que não existe mais
+            state = self.states[self.initial]
+            context.state = state.name
+        # Normalizada uma única vez por turno; todos os matchers comparam contra este texto
+        text = normalize(message)
+        for transition in state.transitions:
+            value = transition.matcher.match(message, text)
+            if value is None:
+                continue
+            messages = list(transition.reply)
+            if transition.action is not None:
+                with span(state.name, transition.action.__name__):
+                    replies = transition.action(context, value)
+                if replies is None:
+                    continue
+                messages += replies
+            if transition.target is not None:
+                messages += self.enter(context, transition.target)
+            return messages
+        return []
+
+    def enter(self, context, name):
+        messages = []
+        entered = set()
+        while name is not None:
+            if name in entered:
+                raise StateMachineError(f"Ciclo de redirecionamentos em {name}")
+            entered.add(name)
+            state = self.states[name]
+            context.state = name
+            if state.on_enter is not None:
+                with span(name, 'on_enter'):
+                    messages += state.on_enter(context)
+            name = state.redirect
+        return messages
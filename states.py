@@ -1,203 +1,248 @@
-from abc import ABC, abstractmethod
-from database import db
-from models import Contrato, Chamado
+from database import read_session
+from models import Chamado
 from context import ConversationContext
-from twilio_helpers import send_auto_messages
-import pandas as pd
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from io import BytesIO
+from session_store import create_session_store
+from contract_cache import contract_cache
+from ticket_cache import ticket_cache
+from notifications import subscribe
+from invalidation import poller as invalidations
+from instrumentation import turn
+from tenants import current_tenant
+import transcript
+from state_machine import StateMachine, StateSpec, Transition
+from matchers import Keywords, Command, Number, Choice, Pattern, Anything
+from ticket_search import ticket_search, SearchNotReady, SearchTimeout
+from contract_summary import get_summary, status_line
+from datetime import datetime
+from sqlalchemy import and_, or_
 import os
+
+CALLS_PAGE_SIZE = int(os.getenv('CALLS_PAGE_SIZE', '20'))
+NEXT_PAGE_COMMANDS = {'mais', 'proxima', 'próxima', '>'}
+PREVIOUS_PAGE_COMMANDS = {'voltar', 'anterior', '<'}
+REPORT_FORMAT_CHOICES = {'1': 'pdf', 'pdf': 'pdf', '2': 'csv', 'csv': 'csv', '3': 'xlsx', 'excel': 'xlsx', 'xlsx': 'xlsx'}
+GREETINGS = ['ola', 'oi', 'oie', 'opa', 'ola tudo bem', 'oi tudo bem', 'tudo bem', 'bom dia', 'boa tarde', 'boa noite', 'e ai']
+# Só mensagens com cara de número de contrato (com algum dígito, sem espaços) chegam ao banco
+CONTRACT_NUMBER_PATTERN = os.getenv('CONTRACT_NUMBER_PATTERN', r'(?=\D*\d)[A-Za-z0-9][A-Za-z0-9./-]{0,63}')
+SEARCH_COMMANDS = ('buscar', 'procurar', 'pesquisar')
+SEARCH_USAGE = 'Digite buscar seguido de uma palavra da descrição do chamado. Exemplo: buscar impressora'
+REPORT_FORMAT_MENU = 'Em qual formato deseja o relatório?\n1. PDF\n2. CSV\n3. Excel'
+MENU = 'Por favor, escolha uma opção:\n1. Ver chamados\n2. Gerar relatório\nOu digite buscar e uma palavra (ex.: buscar impressora)'
+
 class ChatBot:
     def __init__(self):
         # Guarda as conversas que o robô está tendo, cada uma com seu próprio telefone
-        self.conversation_state = {}
-
-    def handle_message(self, phone_number, message):
+        # O backend (memória com LRU/TTL ou SQLite compartilhado) vem de SESSION_STORE
+        self.conversation_state = create_session_store()
+
+    def handle_message(self, phone_number, message, my_twilio_number=None):
+        received_at = datetime.now()
+        # Aplica invalidações de cache publicadas por outros processos (no máximo a cada poucos segundos)
+        invalidations.poll()
+        # O mesmo telefone pode conversar com duas empresas: a conversa é por tenant
+        tenant = current_tenant()
+        session_key = phone_number if tenant.is_default else f'{tenant.name}:{phone_number}'
         # Verifica se já existe uma conversa com esse telefone
-        if phone_number not in self.conversation_state:
+        context = self.conversation_state.get(session_key)
+        if context is None:
             # Se não existir, começa uma nova conversa
-            self.conversation_state[phone_number] = ConversationContext(StartState, phone_number)
+            context = ConversationContext(STATE_MACHINE.initial, phone_number, my_twilio_number)
 
-        # Pede para o estado atual da conversa lidar com a mensagem e obter uma resposta
-        response = self.conversation_state[phone_number].request(message)
+        # A tabela de transições decide a resposta; cada estado roda seus efeitos uma única vez por turno
+        previous_state = context.state
+        new_state = None  # Turno que terminou em exceção: o estado não é salvo
+        try:
+            with turn(phone_number, previous_state):
+                response = STATE_MACHINE.handle(context, message)
+            new_state = context.state
+        finally:
+            # Registrada mesmo quando o turno falha, com o horário de chegada da mensagem
+            transcript.record(phone_number, my_twilio_number, 'in', message, previous_state, new_state,
+                              criado_em=received_at)
+        # Salva o estado de volta para que qualquer worker possa continuar a conversa
+        self.conversation_state.set(session_key, context)
         return response
 
-class State(ABC):
-    def __init__(self, context):
-        self.context = context
-
-    @abstractmethod
-    def handle_request(self, message):
-        pass
-
-    def transition_to(self, new_state_class):
-        self.context.state = new_state_class(self.context)
-        if hasattr(self.context.state, 'auto_respond'):
-            auto_response = self.context.state.auto_respond()
-            if auto_response is None:
-                auto_response = []
-            return auto_response
-        return []
-
-class StartState(State):
-    def handle_request(self, message):
-        if message.lower() in ['ola', 'oi', 'oi, tudo bem?', 'ola, tudo bem?']:
-            return ['Olá! Bem vindo à nossa empresa! Por favor, digite seu número de contrato.']
-        else:
-            contract_id = self.verify_contract(message)
-            if contract_id:
-                self.context.set_contract_id(contract_id)
-                auto_responses = self.transition_to(SelectOptionState)
-                return ['Contrato verificado! Por favor, escolha uma opção:\n1. Ver chamados\n2. Gerar relatório'] + auto_responses
-            else:
-                return ['Contrato não encontrado. Por favor, verifique e digite novamente.']
-
-    def verify_contract(self, contract_number):
-        contrato = Contrato.query.filter_by(numero_contrato=contract_number).first()
-        return contrato.id if contrato else None
-
-class SelectOptionState(State):
-    def handle_request(self, message):
-        if message.strip() == '1':
-            auto_responses = self.transition_to(GetCallsState)
-            return auto_responses
-        elif message.strip() == '2':
-            auto_responses = self.transition_to(GenerateReportState)
-            return auto_responses
-        else:
-            return ['Opção inválida. Por favor, tente novamente.']
-
-class GetCallsState(State):
-    def handle_request(self, message):
-        return self.auto_respond()
-    
-    def auto_respond(self):
-        print("Auto-responding with calls list")
-        response_messages = ["Por favor, aguarde enquanto obtemos os chamados..."]
-        chamados = self.get_calls(self.context.contract_id)
-        if chamados:
-            chamados_msg = "\n".join([f"{chamado.id}: {chamado.descricao}" for chamado in chamados])
-            response_messages.append(chamados_msg)
-        else:
-            response_messages.append("Não há chamados registrados.")
-        response_messages.append("Por favor, digite o número do chamado desejado.")
-        self.transition_to(SelectCallState)
-        print("Final message to send:", response_messages)
-        return response_messages
-
-    def get_calls(self, contract_id):
-        return Chamado.query.filter_by(contrato_id=contract_id).order_by(Chamado.data_chamado.desc()).all()
-
-class SelectCallState(State):
-    def handle_request(self, message):
-        try:
-            call_number = int(message)
-            self.context.set_call_number(call_number)
-            auto_response = self.transition_to(GetCallUpdatesState)
-            return ['Número de chamado verificado!\nPor favor, aguarde enquanto obtemos as atualizações...'] + auto_response
-        except ValueError:
-            return ['Número inválido. Por favor, digite um número de chamado válido.']
-
-class GetCallUpdatesState(State):
-    def handle_request(self, message):
-        return self.auto_respond()
-    
-    def auto_respond(self):
-        updates = self.get_call_updates(self.context.contract_id, self.context.call_number)
-        response_messages = []
-        if updates:
-            response_messages.append(f"Últimas atualizações do chamado {self.context.call_number}: {updates}")
-        else:
-            response_messages.append("Não há atualizações disponíveis para este chamado.")
-        self.transition_to(SelectReturnState)
-        return response_messages
-
-    def get_call_updates(self, contract_id, call_number):
-        chamado = Chamado.query.filter_by(contrato_id=contract_id, id=call_number).first()
-        if chamado:
-            return f"Chamado {chamado.id}: {chamado.descricao} - \nÚltima atualização em {chamado.data_atualizacao.strftime('%d-%m-%y')}:\n {chamado.ultima_atualizacao}"
-        else:
-            return "Chamado não encontrado."
-
-class SelectReturnState(State):
-    def handle_request(self, message):
-        if message.strip() == '1':
-            auto_responses = self.transition_to(SelectOptionState)
-            return ["Retornando ao menu principal..."] + ["Por favor, escolha uma opção:\n1. Ver chamados\n2. Gerar relatório"] + auto_responses
-
-        elif message.strip() == '2':
-            auto_responses = self.transition_to(EndState)
-            return ["Encerrando a sessão. Obrigado!"] + auto_responses
-        else:
-            return ["Opção inválida. Por favor, digite 1 para retornar ao menu principal ou 2 para encerrar a sessão."]
-
-    def auto_respond(self):
-        return ["Opções: \n1. Retornar ao menu principal\n2. Encerrar a sessão."]
-    
-class GenerateReportState(State):
-    def handle_request(self, message):
-        buffer, msg = self.generate_report(self.context.contract_id)
-        if buffer:
-            # Salve o PDF em um arquivo temporário
-            file_path = f'/tmp/report_{self.context.contract_id}.pdf'
-            with open(file_path, 'wb') as f:
-                f.write(buffer.getvalue())
-
-            # Envie o link para download do relatório
-            ngrok_url = os.getenv('NGROK_URL')  # Certifique-se de definir isso no seu .env
-            file_url = f'{ngrok_url}/tmp/report_{self.context.contract_id}.pdf'
-            self.transition_to(EndState)
-            return [f"Relatório gerado com sucesso! Baixe aqui: {file_url}"]
-        else:
-            return [msg]
-
-    def generate_report(self, contract_id):
-            chamados = Chamado.query.filter_by(contrato_id=contract_id).order_by(Chamado.data_chamado.desc()).all()
-            if not chamados:
-                return None, "Não há chamados registrados para este contrato."
-
-            # Converte os dados dos chamados para um DataFrame do pandas
-            data = [{
-                'ID Chamado': chamado.id,
-                'Descrição': chamado.descricao,
-                'Data Chamado': chamado.data_chamado.strftime('%Y-%m-%d'),
-                'Data Atualização': chamado.data_atualizacao.strftime('%Y-%m-%d'),
-                'Última Atualização': chamado.ultima_atualizacao
-            } for chamado in chamados]
-            df = pd.DataFrame(data)
-
-            # Gera um PDF com os dados do DataFrame
-            buffer = BytesIO()
-            p = canvas.Canvas(buffer, pagesize=letter)
-            p.drawString(100, 750, "Relatório de Chamados")
-
-            x_offset = 50
-            y_offset = 700
-            p.drawString(x_offset, y_offset, "ID Chamado")
-            p.drawString(x_offset + 100, y_offset, "Descrição")
-            p.drawString(x_offset + 300, y_offset, "Data Chamado")
-            p.drawString(x_offset + 400, y_offset, "Data Atualização")
-            p.drawString(x_offset + 500, y_offset, "Última Atualização")
-
-            y_offset -= 20
-            for _, row in df.iterrows():
-                p.drawString(x_offset, y_offset, str(row['ID Chamado']))
-                p.drawString(x_offset + 100, y_offset, row['Descrição'])
-                p.drawString(x_offset + 300, y_offset, row['Data Chamado'])
-                p.drawString(x_offset + 400, y_offset, row['Data Atualização'])
-                p.drawString(x_offset + 500, y_offset, row['Última Atualização'])
-                y_offset -= 20
-
-            p.save()
-            buffer.seek(0)
-            return buffer, "Relatório gerado com sucesso!"
-
-class EndState(State):
-    def handle_request(self, message):
-        return ['Atendimento concluído. Obrigado por usar nossos serviços!']
-
-    def auto_respond(self):
-        # Reiniciar o contexto para o estado inicial, se necessário
-        self.context.state = StartState(self.context)
-        return []
+# Handlers: funções sem estado próprio, tudo o que é da conversa fica no contexto
+
+def verify_contract(context, contract_number):
+    contract_id = contract_cache.get(contract_number)
+    if not contract_id:
+        return None
+    context.set_contract_id(contract_id)
+    # Uma linha de situação lida do resumo do contrato (contract_summary.py), se ele já existir
+    summary = get_summary(contract_id)
+    status = status_line(summary) + '\n' if summary else ''
+    return ['Contrato verificado! ' + status + MENU]
+
+def list_first_page(context):
+    return ["Por favor, aguarde enquanto obtemos os chamados..."] + list_calls(context)
+
+def next_page(context, command):
+    return list_calls(context, 'next')
+
+def previous_page(context, command):
+    return list_calls(context, 'previous')
+
+def list_calls(context, direction=None):
+    # direction: None para a primeira página, 'next' ou 'previous' a partir do cursor salvo
+    cursor = context.calls_cursor
+    if direction == 'next' and cursor:
+        chamados, has_more = get_calls(context.contract_id, after=cursor[2:])
+    elif direction == 'previous' and cursor:
+        chamados, has_more = get_calls(context.contract_id, before=cursor[:2])
+    else:
+        chamados, has_more = get_calls(context.contract_id)
+
+    response_messages = []
+    if chamados:
+        first, last = chamados[0], chamados[-1]
+        context.set_calls_cursor([first.data_chamado.isoformat(), first.id, last.data_chamado.isoformat(), last.id])
+        chamados_msg = "\n".join([f"{chamado.id}: {chamado.descricao}" for chamado in chamados])
+        response_messages.append(chamados_msg)
+    elif direction:
+        response_messages.append("Não há mais chamados nessa direção.")
+    else:
+        context.set_calls_cursor(None)
+        response_messages.append("Não há chamados registrados.")
+
+    has_next = has_more if direction != 'previous' else bool(cursor)
+    # Depois de um 'mais' sem resultados o cursor continua na última página mostrada, e 'voltar' parte dela
+    has_previous = has_more if direction == 'previous' else direction == 'next' and bool(chamados or cursor)
+    page_hints = []
+    if has_next:
+        page_hints.append("'mais' para a próxima página")
+    if has_previous:
+        page_hints.append("'voltar' para a página anterior")
+    prompt = "Por favor, digite o número do chamado desejado."
+    if page_hints:
+        prompt += " Ou digite " + " ou ".join(page_hints) + "."
+    response_messages.append(prompt)
+    return response_messages
+
+def get_calls(contract_id, after=None, before=None):
+    # Paginação por keyset em (data_chamado, id), usando o índice ix_chamados_contrato_data.
+    # Retorna a página em ordem decrescente e se existe mais uma página na mesma direção.
+    query = read_session.query(Chamado.id, Chamado.descricao, Chamado.data_chamado).filter(
+        Chamado.contrato_id == contract_id
+    )
+    if before:
+        data_chamado, call_id = datetime.fromisoformat(before[0]), before[1]
+        query = query.filter(or_(
+            Chamado.data_chamado > data_chamado,
+            and_(Chamado.data_chamado == data_chamado, Chamado.id > call_id),
+        )).order_by(Chamado.data_chamado.asc(), Chamado.id.asc())
+    else:
+        if after:
+            data_chamado, call_id = datetime.fromisoformat(after[0]), after[1]
+            query = query.filter(or_(
+                Chamado.data_chamado < data_chamado,
+                and_(Chamado.data_chamado == data_chamado, Chamado.id < call_id),
+            ))
+        query = query.order_by(Chamado.data_chamado.desc(), Chamado.id.desc())
+    rows = query.limit(CALLS_PAGE_SIZE + 1).all()
+    has_more = len(rows) > CALLS_PAGE_SIZE
+    rows = rows[:CALLS_PAGE_SIZE]
+    if before:
+        rows.reverse()
+    return rows, has_more
+
+def search_calls(context, term):
+    # Busca por palavra em descricao e ultima_atualizacao (ticket_search.py), mais relevantes primeiro
+    try:
+        chamados = ticket_search.search(context.contract_id, term)
+    except SearchNotReady:
+        return ["A busca deste contrato está sendo preparada. Por favor, tente novamente em alguns segundos."]
+    except SearchTimeout:
+        return ["A busca demorou mais que o esperado. Por favor, tente novamente ou use uma palavra mais específica."]
+    # A listagem paginada recomeça do início depois de uma busca
+    context.set_calls_cursor(None)
+    if not chamados:
+        return [f"Nenhum chamado encontrado para '{term}'. Digite o número de um chamado ou busque outra palavra."]
+    chamados_msg = "\n".join(
+        f"{chamado.id}: {chamado.descricao} (atualizado em {chamado.data_atualizacao:%d-%m-%y})" for chamado in chamados)
+    return [chamados_msg, "Por favor, digite o número do chamado desejado."]
+
+def select_call(context, call_number):
+    context.set_call_number(call_number)
+    return ['Número de chamado verificado!\nPor favor, aguarde enquanto obtemos as atualizações...']
+
+def show_call_updates(context):
+    updates = get_call_updates(context.contract_id, context.call_number)
+    if updates is None:
+        # Chamado de outro contrato (ou inexistente): sem dados dele e sem inscrição para avisos
+        return ["Chamado não encontrado."]
+    # Quem consulta um chamado passa a receber os avisos de atualização dele (notifications.py)
+    subscribe(context.phone_number, context.my_twilio_number, context.call_number, context.contract_id)
+    if updates:
+        return [f"Últimas atualizações do chamado {context.call_number}: {updates}"]
+    return ["Não há atualizações disponíveis para este chamado."]
+
+def get_call_updates(contract_id, call_number):
+    # Resposta já formatada; o cache confirma por data_atualizacao se o chamado mudou
+    return ticket_cache.get(contract_id, call_number)
+
+def show_return_options(context):
+    return ["Opções: \n1. Retornar ao menu principal\n2. Encerrar a sessão."]
+
+def request_report(context, fmt):
+    # Importados só quando alguém pede relatório: o boot dos workers não paga por eles
+    from reports import report_name, submit_report
+    from report_jobs import JobQueueFullError
+    import artifacts
+    name = report_name(context.contract_id, fmt)
+    if name is None:
+        return None
+    if artifacts.exists(name):
+        # Contrato sem mudanças desde o último relatório: responde na hora
+        return [f"Relatório gerado com sucesso! Baixe aqui: {artifacts.signed_url(name)}"]
+    try:
+        job_id = submit_report(context.contract_id, fmt, context.phone_number, context.my_twilio_number)
+    except JobQueueFullError:
+        return ["Muitos relatórios em preparação no momento. Por favor, tente novamente em alguns minutos."]
+    return [f"Seu relatório está sendo preparado (pedido {job_id[:8]}). Enviaremos o link assim que ficar pronto."]
+
+# O fluxo da conversa como dados: matchers compilados na importação e validados pelo StateMachine.
+# Os nomes dos estados são os mesmos gravados nos session stores.
+STATE_MACHINE = StateMachine('StartState', [
+    StateSpec('StartState', [
+        # Só a saudação sozinha: com prefixo, "oi CT000002" virava saudação e o número era descartado
+        Transition(Keywords(*GREETINGS),
+                   reply=['Olá! Bem vindo à nossa empresa! Por favor, digite seu número de contrato.']),
+        Transition(Pattern(CONTRACT_NUMBER_PATTERN), 'SelectOptionState', action=verify_contract),
+        Transition(Pattern(CONTRACT_NUMBER_PATTERN),
+                   reply=['Contrato não encontrado. Por favor, verifique e digite novamente.']),
+        Transition(Anything(), reply=['Não entendi. Por favor, digite seu número de contrato.']),
+    ]),
+    StateSpec('SelectOptionState', [
+        Transition(Keywords('1', 'ver chamados', 'chamados'), 'GetCallsState'),
+        Transition(Keywords('2', 'gerar relatorio', 'relatorio'), 'GenerateReportState',
+                   reply=[REPORT_FORMAT_MENU]),
+        Transition(Command(*SEARCH_COMMANDS), 'SelectCallState', action=search_calls),
+        Transition(Keywords(*SEARCH_COMMANDS), reply=[SEARCH_USAGE]),
+        Transition(Anything(), reply=['Opção inválida. Por favor, tente novamente.']),
+    ]),
+    StateSpec('GetCallsState', on_enter=list_first_page, redirect='SelectCallState'),
+    StateSpec('SelectCallState', [
+        Transition(Keywords(*NEXT_PAGE_COMMANDS), action=next_page),
+        Transition(Keywords(*PREVIOUS_PAGE_COMMANDS), action=previous_page),
+        Transition(Command(*SEARCH_COMMANDS), action=search_calls),
+        Transition(Keywords(*SEARCH_COMMANDS), reply=[SEARCH_USAGE]),
+        Transition(Number(), 'GetCallUpdatesState', action=select_call),
+        Transition(Anything(), reply=['Número inválido. Por favor, digite um número de chamado válido.']),
+    ]),
+    StateSpec('GetCallUpdatesState', on_enter=show_call_updates, redirect='SelectReturnState'),
+    StateSpec('SelectReturnState', [
+        Transition(Keywords('1', 'menu', 'menu principal'), 'SelectOptionState',
+                   reply=["Retornando ao menu principal...", MENU]),
+        Transition(Keywords('2', 'encerrar', 'sair', 'tchau'), 'EndState', reply=["Encerrando a sessão. Obrigado!"]),
+        Transition(Anything(), 'SelectReturnState',
+                   reply=["Opção inválida. Por favor, digite 1 para retornar ao menu principal ou 2 para encerrar a sessão."]),
+    ], on_enter=show_return_options),
+    StateSpec('GenerateReportState', [
+        Transition(Choice(REPORT_FORMAT_CHOICES, default='pdf'), 'EndState', action=request_report),
+        Transition(Anything(), reply=['Formato inválido.', REPORT_FORMAT_MENU]),
+    ]),
+    # Fim do atendimento: volta direto ao início para a próxima mensagem
+    StateSpec('EndState', redirect='StartState'),
+])
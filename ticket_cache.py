@@ -0,0 +1,113 @@
+# ticket_cache.py
+import os
+import threading
+import time
+from sqlalchemy import event, inspect
+from cache import TTLCache
+from database import read_session
+from models import Chamado
+from invalidation import register
+from tenants import PerTenant
+
+
+class TicketUpdatesCache:
+    # Guarda a resposta já formatada de cada chamado, por (contract_id, id do chamado).
+    # Dentro de probe_interval segundos a resposta sai direto do cache; depois disso uma consulta
+    # só de data_atualizacao confirma se o chamado mudou antes de reaproveitá-la.
+    def __init__(self, loader, probe, max_size=10000, ttl=300, probe_interval=5):
+        self.loader = loader
+        self.probe = probe
+        self.probe_interval = probe_interval
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.probes = 0
+        self.loads = 0
+
+    def get(self, contract_id, call_id):
+        key = (contract_id, call_id)
+        entry = self._cache.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            data_atualizacao, text, checked_at = entry
+            if now - checked_at < self.probe_interval:
+                self._count('hits')
+                return text
+            self._count('probes')
+            if self.probe(contract_id, call_id) == data_atualizacao:
+                self._cache.set(key, (data_atualizacao, text, now))
+                return text
+        self._count('loads')
+        data_atualizacao, text = self.loader(contract_id, call_id)
+        self._cache.set(key, (data_atualizacao, text, now))
+        return text
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def invalidate(self, contract_id=None, call_id=None):
+        # Sem argumentos, descarta tudo (ex.: depois de uma importação em massa)
+        if contract_id is None:
+            self._cache.clear()
+        else:
+            self._cache.delete((contract_id, call_id))
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._cache), 'hits': self.hits, 'probes': self.probes, 'loads': self.loads}
+
+
+def format_call_updates(chamado):
+    return f"Chamado {chamado.id}: {chamado.descricao} - \nÚltima atualização em {chamado.data_atualizacao.strftime('%d-%m-%y')}:\n {chamado.ultima_atualizacao}"
+
+
+def load_call_updates(contract_id, call_id):
+    chamado = read_session.query(
+        Chamado.id, Chamado.descricao, Chamado.data_atualizacao, Chamado.ultima_atualizacao
+    ).filter_by(contrato_id=contract_id, id=call_id).first()
+    if chamado is None:
+        # Inexistente ou de outro contrato; o probe também devolve None, então o resultado fica em cache
+        return None, None
+    return chamado.data_atualizacao, format_call_updates(chamado)
+
+
+def probe_call_updated_at(contract_id, call_id):
+    # Consulta pela chave primária que só lê data_atualizacao
+    return read_session.query(Chamado.data_atualizacao).filter_by(contrato_id=contract_id, id=call_id).scalar()
+
+
+ticket_cache = PerTenant(lambda: TicketUpdatesCache(
+    load_call_updates,
+    probe_call_updated_at,
+    max_size=int(os.getenv('TICKET_CACHE_SIZE', '10000')),
+    ttl=int(os.getenv('TICKET_CACHE_TTL', '300')),
+    probe_interval=float(os.getenv('TICKET_CACHE_PROBE_INTERVAL', '5')),
+))
+
+
+def invalidate_ticket(contract_id=None, call_id=None):
+    # Para o sistema de chamados avisar que ultima_atualizacao mudou
+    ticket_cache.invalidate(contract_id, call_id)
+
+
+def _invalidate_published(key):
+    # Chave publicada em invalidation.py: 'contrato_id:chamado_id', ou None para tudo
+    if key is None:
+        ticket_cache.invalidate()
+    else:
+        contract_id, call_id = key.split(':')
+        ticket_cache.invalidate(int(contract_id), int(call_id))
+
+
+register('ticket', _invalidate_published)
+
+
+@event.listens_for(Chamado, 'after_insert')
+@event.listens_for(Chamado, 'after_update')
+@event.listens_for(Chamado, 'after_delete')
+def _invalidate_on_change(mapper, connection, target):
+    # Alterações feitas pelo próprio app, inclusive o contrato antigo se o chamado mudou de contrato
+    history = inspect(target).attrs.contrato_id.history
+    for contract_id in {target.contrato_id, *history.deleted}:
+        ticket_cache.invalidate(contract_id, target.id)
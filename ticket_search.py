@@ -0,0 +1,349 @@
+# ticket_search.py
+# Busca de chamados por palavra ("buscar impressora") em descricao e ultima_atualizacao.
+#
+#   SEARCH_BACKEND=fulltext - MATCH ... AGAINST no índice FULLTEXT ix_chamados_busca (MySQL)
+#   SEARCH_BACKEND=memory   - índice invertido em memória por contrato, atualizado por data_atualizacao
+#   SEARCH_BACKEND=auto     - fulltext no MySQL, memory nos demais (padrão)
+#
+# As duas formas ordenam por relevância e respeitam SEARCH_TIMEOUT_MS por consulta.
+import heapq
+import math
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from sqlalchemy import and_, or_, text
+from sqlalchemy.exc import DBAPIError
+from cache import TTLCache
+from database import get_app, read_session
+from models import Chamado
+from matchers import normalize, tokenize
+from invalidation import register
+from tenants import PerTenant, current_tenant, use_tenant
+from instrumentation import logger
+
+SEARCH_RESULTS = int(os.getenv('SEARCH_RESULTS', '10'))
+SEARCH_TIMEOUT = int(os.getenv('SEARCH_TIMEOUT_MS', '500')) / 1000
+SEARCH_REFRESH_INTERVAL = float(os.getenv('SEARCH_REFRESH_INTERVAL', '5'))
+# Palavras que aparecem em quase todo chamado e não ajudam a ordenar
+STOPWORDS = {'a', 'o', 'e', 'as', 'os', 'de', 'da', 'do', 'das', 'dos', 'em', 'na', 'no', 'nas', 'nos', 'um',
+             'uma', 'para', 'por', 'com', 'que', 'se', 'ao', 'foi', 'sem'}
+DESCRIPTION_WEIGHT = 2.0  # Palavra na descrição vale mais que na última atualização
+PREFIX_WEIGHT = 0.5  # 'impress' também encontra 'impressora', com peso menor que a palavra exata
+SCORE_SLICE = 10000  # Ids pontuados entre duas conferências do prazo
+REFRESH_APPLY_BATCH = 1000  # Linhas aplicadas ao índice por vez, para não segurar o lock das buscas
+MYSQL_QUERY_TIMEOUT = 3024  # ER_QUERY_TIMEOUT: consulta interrompida pelo MAX_EXECUTION_TIME
+
+
+class SearchNotReady(Exception):
+    # O índice do contrato ainda está sendo montado; a próxima tentativa deve encontrá-lo pronto
+    pass
+
+
+class SearchTimeout(Exception):
+    # A consulta passou de SEARCH_TIMEOUT; uma palavra mais específica costuma resolver
+    pass
+
+
+def search_terms(value):
+    # Mesmo tratamento do texto indexado: sem acentos, minúsculas e sem palavras vazias
+    return [t for t in dict.fromkeys(tokenize(normalize(value))) if (len(t) > 1 or t.isdigit()) and t not in STOPWORDS]
+
+
+class ContractSearchIndex:
+    # Índice invertido de um contrato: palavra -> ids dos chamados, num array compacto por campo.
+    # Chamados alterados são indexados de novo no fim dos arrays; as entradas antigas ficam para trás e são
+    # descartadas na conferência do resultado, e o índice é refeito quando elas passam de um quarto do total.
+    def __init__(self, contract_id):
+        self.contract_id = contract_id
+        self.fields = ({}, {})  # (descricao, ultima_atualizacao)
+        self.ids = set()
+        self.doc_count = 0
+        self.reindexed = 0
+        self.mark = None  # (data_atualizacao, id) do último chamado lido
+        self.dirty = set()  # Ids invalidados por outros processos, relidos no próximo refresh
+        self.ready = threading.Event()
+        self.rebuilding = False
+        self.refreshing = None  # Event do refresh em andamento
+        self.refreshed_at = 0.0
+        self._vocabulary = None
+        self._lock = threading.Lock()
+
+    def add(self, call_id, descricao, ultima_atualizacao):
+        for postings, value in zip(self.fields, (descricao, ultima_atualizacao)):
+            for token in set(search_terms(value or '')):
+                ids = postings.get(token)
+                if ids is None:
+                    ids = postings[token] = array('i')
+                    self._vocabulary = None
+                ids.append(call_id)
+        if call_id in self.ids:
+            self.reindexed += 1
+        else:
+            self.ids.add(call_id)
+            self.doc_count += 1
+
+    def needs_rebuild(self):
+        return self.reindexed > max(1000, self.doc_count // 4)
+
+    def _expand(self, term, prefix):
+        # A palavra exata e, para a última palavra digitada, as que começam com ela
+        matches = [(term, 1.0)]
+        if prefix and len(term) >= 3:
+            if self._vocabulary is None:
+                self._vocabulary = sorted(set(self.fields[0]) | set(self.fields[1]))
+            i = bisect_left(self._vocabulary, term)
+            while i < len(self._vocabulary) and self._vocabulary[i].startswith(term) and len(matches) < 50:
+                if self._vocabulary[i] != term:
+                    matches.append((self._vocabulary[i], PREFIX_WEIGHT))
+                i += 1
+        return matches
+
+    def search(self, terms, limit, deadline):
+        # Retorna ids candidatos em ordem de relevância (tf-idf simplificado); para no prazo com o que já pontuou
+        scores = {}
+        total = max(1, self.doc_count)
+        with self._lock:
+            expanded = [(token, weight) for n, term in enumerate(terms)
+                        for token, weight in self._expand(term, prefix=n == len(terms) - 1)]
+            for token, weight in expanded:
+                for postings, field_weight in zip(self.fields, (DESCRIPTION_WEIGHT, 1.0)):
+                    ids = postings.get(token)
+                    if not ids:
+                        continue
+                    score = weight * field_weight * math.log(1 + total / len(ids))
+                    # Confere o prazo a cada fatia: palavras muito comuns têm listas enormes
+                    for start in range(0, len(ids), SCORE_SLICE):
+                        for call_id in ids[start:start + SCORE_SLICE]:
+                            scores[call_id] = scores.get(call_id, 0.0) + score
+                        if time.monotonic() > deadline:
+                            break
+                if time.monotonic() > deadline:
+                    break
+        # Tuplas (pontuação, id) comparadas em C: bem mais rápido que uma key em Python com muitos candidatos
+        return [call_id for _, call_id in heapq.nlargest(limit, zip(scores.values(), scores.keys()))]
+
+
+def _index_rows(query):
+    return query.with_entities(
+        Chamado.id, Chamado.descricao, Chamado.ultima_atualizacao, Chamado.data_atualizacao
+    ).yield_per(5000)
+
+
+def build_index(index):
+    # Leitura completa do contrato em ordem de (data_atualizacao, id), em lotes
+    query = read_session.query(Chamado).filter(Chamado.contrato_id == index.contract_id).order_by(
+        Chamado.data_atualizacao, Chamado.id)
+    for row in _index_rows(query):
+        index.add(row.id, row.descricao, row.ultima_atualizacao)
+        index.mark = (row.data_atualizacao, row.id)
+    index.refreshed_at = time.monotonic()
+    index.ready.set()
+
+
+def refresh_index(index):
+    # Só os chamados do contrato alterados depois da marca (índice ix_chamados_contrato_atualizacao)
+    # e os invalidados por outros processos. Lê fora do lock e aplica em lotes, com o lock só durante cada lote.
+    with index._lock:
+        mark = index.mark
+        dirty, index.dirty = index.dirty, set()
+    filters = [Chamado.contrato_id == index.contract_id]
+    if mark is not None:
+        data_atualizacao, call_id = mark
+        changed = or_(Chamado.data_atualizacao > data_atualizacao,
+                      and_(Chamado.data_atualizacao == data_atualizacao, Chamado.id > call_id))
+        filters.append(or_(changed, Chamado.id.in_(dirty)) if dirty else changed)
+    query = read_session.query(Chamado).filter(*filters).order_by(Chamado.data_atualizacao, Chamado.id)
+    try:
+        batch = []
+        for row in _index_rows(query):
+            batch.append(row)
+            if len(batch) == REFRESH_APPLY_BATCH:
+                _apply(index, batch)
+                batch = []
+        _apply(index, batch)
+    except Exception:
+        # Os ids invalidados voltam para o próximo refresh
+        with index._lock:
+            index.dirty |= dirty
+        raise
+    index.refreshed_at = time.monotonic()
+
+
+def _apply(index, rows):
+    with index._lock:
+        for row in rows:
+            index.add(row.id, row.descricao, row.ultima_atualizacao)
+            if index.mark is None or (row.data_atualizacao, row.id) > index.mark:
+                index.mark = (row.data_atualizacao, row.id)
+
+
+class MemorySearch:
+    # Um índice por contrato, montado numa thread na primeira busca; a busca espera no máximo SEARCH_TIMEOUT
+    def __init__(self, max_contracts=50, ttl=3600):
+        self._indexes = TTLCache(max_size=max_contracts, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def _get_index(self, contract_id):
+        with self._lock:
+            index = self._indexes.get(contract_id)
+            if index is None:
+                # Primeira busca do contrato: quem chegar enquanto monta espera pelo mesmo índice
+                index = ContractSearchIndex(contract_id)
+                self._indexes.set(contract_id, index)
+                self._start_build(index)
+            elif index.needs_rebuild() and not index.rebuilding:
+                # O índice atual continua respondendo até o novo ficar pronto
+                index.rebuilding = True
+                self._start_build(ContractSearchIndex(contract_id))
+        return index
+
+    def _start_build(self, index):
+        threading.Thread(target=self._build, args=(index, current_tenant()), name='search-index', daemon=True).start()
+
+    def _build(self, index, tenant):
+        try:
+            with get_app().app_context(), use_tenant(tenant):
+                build_index(index)
+            self._indexes.set(index.contract_id, index)
+        except Exception:
+            # Sem índice no cache, a próxima busca tenta montar de novo
+            self._indexes.delete(index.contract_id)
+            logger.exception('search_index_build_failed')
+
+    def _start_refresh(self, index):
+        # Um refresh por índice de cada vez, numa thread; retorna o Event que marca o fim dele
+        with self._lock:
+            if index.refreshing is not None:
+                return index.refreshing
+            done = index.refreshing = threading.Event()
+        threading.Thread(target=self._refresh, args=(index, current_tenant(), done), name='search-refresh',
+                         daemon=True).start()
+        return done
+
+    def _refresh(self, index, tenant, done):
+        try:
+            with get_app().app_context(), use_tenant(tenant):
+                refresh_index(index)
+        except Exception:
+            logger.exception('search_index_refresh_failed')
+        finally:
+            with self._lock:
+                index.refreshing = None
+            done.set()
+
+    def search(self, contract_id, query_text, limit=SEARCH_RESULTS):
+        deadline = time.monotonic() + SEARCH_TIMEOUT
+        terms = search_terms(query_text)
+        if not terms:
+            return []
+        index = self._get_index(contract_id)
+        if not index.ready.wait(max(0.0, deadline - time.monotonic())):
+            raise SearchNotReady(contract_id)
+        if time.monotonic() - index.refreshed_at > SEARCH_REFRESH_INTERVAL or index.dirty:
+            # Espera o refresh no máximo um quarto do prazo; se ele demorar (ex.: depois de uma importação),
+            # responde com o índice como está e as próximas buscas já o encontram aplicado
+            self._start_refresh(index).wait(min(SEARCH_TIMEOUT / 4, max(0.0, deadline - time.monotonic())))
+        # Busca o dobro de candidatos: alguns podem ser entradas antigas de chamados já alterados.
+        # A pontuação para um quarto do prazo antes do fim, que fica para ler os chamados escolhidos.
+        candidates = index.search(terms, limit * 2, deadline - SEARCH_TIMEOUT / 4)
+        return _load_results(contract_id, candidates, terms, limit)
+
+    def invalidate(self, contract_id=None, call_id=None):
+        if contract_id is None:
+            self._indexes.clear()
+            return
+        index = self._indexes.get(contract_id)
+        if index is not None:
+            with index._lock:
+                index.dirty.add(call_id)
+
+
+def _load_results(contract_id, candidates, terms, limit):
+    # Lê os chamados candidatos e confere que o texto atual ainda tem alguma das palavras
+    if not candidates:
+        return []
+    rows = {row.id: row for row in read_session.query(
+        Chamado.id, Chamado.descricao, Chamado.ultima_atualizacao, Chamado.data_atualizacao
+    ).filter(Chamado.contrato_id == contract_id, Chamado.id.in_(candidates))}
+    results = []
+    for call_id in candidates:
+        row = rows.get(call_id)
+        if row is None:
+            continue
+        tokens = set(search_terms(f'{row.descricao} {row.ultima_atualizacao}'))
+        if any(token.startswith(term) for term in terms for token in tokens):
+            results.append(row)
+        if len(results) == limit:
+            break
+    return results
+
+
+class FullTextSearch:
+    # MATCH ... AGAINST em modo booleano: todas as palavras com '*' no fim, ordenado pela relevância do MySQL.
+    # O hint MAX_EXECUTION_TIME interrompe consultas que passariam do prazo.
+    def search(self, contract_id, query_text, limit=SEARCH_RESULTS):
+        terms = search_terms(query_text)
+        if not terms:
+            return []
+        query = ' '.join(f'{term}*' for term in terms)
+        try:
+            return self._execute(contract_id, query, limit)
+        except DBAPIError as e:
+            if _mysql_errno(e) != MYSQL_QUERY_TIMEOUT:
+                raise
+            read_session.rollback()
+            raise SearchTimeout(contract_id) from e
+
+    def _execute(self, contract_id, query, limit):
+        return read_session.execute(text(
+            f'SELECT /*+ MAX_EXECUTION_TIME({int(SEARCH_TIMEOUT * 1000)}) */ '
+            'id, descricao, ultima_atualizacao, data_atualizacao, '
+            'MATCH(descricao, ultima_atualizacao) AGAINST (:query IN BOOLEAN MODE) AS score '
+            'FROM chamados WHERE contrato_id = :contract_id '
+            'AND MATCH(descricao, ultima_atualizacao) AGAINST (:query IN BOOLEAN MODE) '
+            'ORDER BY score DESC, id DESC LIMIT :limit'
+        ), {'query': query, 'contract_id': contract_id, 'limit': limit}).all()
+
+    def invalidate(self, contract_id=None, call_id=None):
+        pass  # O MySQL mantém o índice FULLTEXT sozinho
+
+
+def _mysql_errno(error):
+    # mysqlconnector expõe errno; mysqldb e pymysql, o código em args[0]
+    orig = getattr(error, 'orig', None)
+    errno = getattr(orig, 'errno', None)
+    if errno is None and orig is not None and orig.args:
+        errno = orig.args[0]
+    return errno
+
+
+def create_search():
+    backend = os.getenv('SEARCH_BACKEND', 'auto')
+    if backend == 'auto':
+        backend = 'fulltext' if read_session.get_bind().dialect.name == 'mysql' else 'memory'
+    if backend == 'fulltext':
+        return FullTextSearch()
+    if backend == 'memory':
+        return MemorySearch(
+            max_contracts=int(os.getenv('SEARCH_INDEX_MAX_CONTRACTS', '50')),
+            ttl=int(os.getenv('SEARCH_INDEX_TTL', '3600')),
+        )
+    raise ValueError(f"SEARCH_BACKEND desconhecido: {backend}")
+
+
+# Criado no primeiro uso de cada tenant, quando já se sabe qual é o banco dele
+ticket_search = PerTenant(create_search)
+
+
+def _invalidate_published(key):
+    # Mesmas chaves do ticket_cache: 'contrato_id:chamado_id', ou None para tudo
+    if key is None:
+        ticket_search.invalidate()
+    else:
+        contract_id, call_id = key.split(':')
+        ticket_search.invalidate(int(contract_id), int(call_id))
+
+
+register('ticket', _invalidate_published)
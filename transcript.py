@@ -0,0 +1,226 @@
+# transcript.py
+# Registro das conversas (mensagem recebida com o estado antes/depois e cada resposta enviada).
+# O turno só coloca o registro num buffer em memória; uma thread grava em lotes, por tamanho ou por
+# tempo, na tabela transcricoes (TRANSCRIPT_SINK=db) ou em arquivos JSONL compactados (jsonl).
+import atexit
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from database import db, get_app
+from models import Transcricao
+from tenants import registry as tenants, use_tenant
+from instrumentation import log_event, logger
+
+FIELDS = ('criado_em', 'telefone', 'numero_twilio', 'direcao', 'estado_anterior', 'estado_novo', 'mensagem')
+
+
+class PartialWriteError(Exception):
+    # Parte do lote foi gravada; só os registros em `failed` voltam para o buffer
+    def __init__(self, failed, error):
+        super().__init__(repr(error))
+        self.failed = failed
+        self.error = error
+
+
+class TranscriptLog:
+    # Buffer limitado a max_pending registros. Cheio, a política decide: 'drop' descarta o registro novo
+    # (o turno nunca espera) e 'block' espera até block_timeout segundos por espaço antes de descartar.
+    def __init__(self, sink, batch_size=500, flush_interval=2, max_pending=50000, policy='drop', block_timeout=0.05):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # Uma gravação por vez, inclusive a do atexit
+        self._wakeup = threading.Condition(self._lock)
+        self._space = threading.Condition(self._lock)
+        self._thread = None
+        self._pid = None
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    def record(self, telefone, numero_twilio, direcao, mensagem, estado_anterior=None, estado_novo=None,
+               criado_em=None):
+        item = (criado_em or datetime.now(), telefone, numero_twilio, direcao, estado_anterior, estado_novo, mensagem)
+        with self._lock:
+            if self._pid != os.getpid():
+                # Criado sob demanda para não iniciar a thread antes do fork do gunicorn. Num processo
+                # filho, o que veio no buffer copiado é do pai, que grava por conta própria.
+                self._pending.clear()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='transcript-flush', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            if len(self._pending) >= self.max_pending:
+                if self.policy == 'block':
+                    self._wakeup.notify()
+                    self._space.wait_for(lambda: len(self._pending) < self.max_pending, self.block_timeout)
+                if len(self._pending) >= self.max_pending:
+                    self.dropped += 1
+                    return False
+            self._pending.append(item)
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.notify()
+        return True
+
+    def _run(self):
+        failures = 0
+        while True:
+            if failures:
+                # O lote devolvido mantém o buffer cheio e acordaria a thread na hora: depois de uma falha
+                # espera o intervalo inteiro, dobrando a cada falha seguida (até 60 s)
+                time.sleep(min(self.flush_interval * 2 ** (failures - 1), 60))
+            else:
+                with self._lock:
+                    self._wakeup.wait_for(lambda: len(self._pending) >= self.batch_size, self.flush_interval)
+            failed_flushes = self.failed_flushes
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('transcript_flush_failed')
+                failures += 1
+                continue
+            failures = failures + 1 if self.failed_flushes > failed_flushes else 0
+
+    def flush(self):
+        # Grava tudo o que está no buffer, em lotes de batch_size; retorna quantos registros foram gravados
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                    self._space.notify_all()
+                if not batch:
+                    return written
+                try:
+                    self.sink.write(batch)
+                except Exception as e:
+                    failed = e.failed if isinstance(e, PartialWriteError) else batch
+                    self._requeue(failed)
+                    written += len(batch) - len(failed)
+                    with self._lock:
+                        self.written += len(batch) - len(failed)
+                        self.failed_flushes += 1
+                    log_event('transcript_write_failed', logging.WARNING, records=len(failed),
+                              error=repr(getattr(e, 'error', e)))
+                    return written
+                written += len(batch)
+                with self._lock:
+                    self.written += len(batch)
+
+    def _requeue(self, batch):
+        # Devolve o lote para a próxima tentativa sem passar de max_pending; o excedente é descartado
+        with self._lock:
+            room = max(0, self.max_pending - len(self._pending))
+            self._pending.extendleft(reversed(batch[:room]))
+            self.dropped += len(batch) - min(room, len(batch))
+
+    def close(self):
+        # Chamado no atexit: a última gravação acontece antes do processo sair
+        return self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {'pending': len(self._pending), 'written': self.written, 'dropped': self.dropped,
+                    'failed_flushes': self.failed_flushes}
+
+
+class DatabaseSink:
+    # Um INSERT em lote por tenant; o tenant sai do número Twilio de cada registro. Cada tenant tem a
+    # própria transação: se um banco falhar, só os registros dele voltam para o buffer.
+    def write(self, batch):
+        by_tenant = defaultdict(list)
+        for item in batch:
+            by_tenant[tenants.for_number(item[2])].append(item)
+        failed, error = [], None
+        for tenant, items in by_tenant.items():
+            try:
+                with get_app().app_context(), use_tenant(tenant):
+                    db.session.execute(insert(Transcricao), [dict(zip(FIELDS, item)) for item in items])
+                    db.session.commit()
+            except Exception as e:
+                failed.extend(items)
+                error = e
+        if failed:
+            raise PartialWriteError(failed, error)
+
+
+class JSONLSink:
+    # Arquivos transcript-<pid>-<início>.jsonl.gz; cada lote vira um membro gzip completo, então um
+    # arquivo interrompido no meio continua legível. Troca de arquivo ao passar de max_bytes ou max_age.
+    def __init__(self, directory, max_bytes=64 * 1024 ** 2, max_age=3600, retention_days=30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.retention = timedelta(days=retention_days)
+        self._path = None
+        self._pid = None
+        self._opened_at = 0.0
+
+    def _current_path(self):
+        now = time.time()
+        if (self._path is None or self._pid != os.getpid() or now - self._opened_at > self.max_age
+                or (os.path.exists(self._path) and os.path.getsize(self._path) > self.max_bytes)):
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+            # O pid no nome evita que dois workers escrevam no mesmo arquivo
+            self._path = os.path.join(self.directory, f'transcript-{os.getpid()}-{stamp}.jsonl.gz')
+            self._pid = os.getpid()
+            self._opened_at = now
+            self._remove_expired()
+        return self._path
+
+    def write(self, batch):
+        lines = ''.join(json.dumps(dict(zip(FIELDS, item)), ensure_ascii=False, default=str) + '\n' for item in batch)
+        with gzip.open(self._current_path(), 'at', encoding='utf-8', compresslevel=6) as f:
+            f.write(lines)
+
+    def _remove_expired(self):
+        limit = time.time() - self.retention.total_seconds()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('transcript-') and os.path.getmtime(path) < limit:
+                os.remove(path)
+
+
+def create_transcript_log():
+    # Escolhe o destino pelas variáveis de ambiente (TRANSCRIPT_SINK=jsonl|db|off)
+    backend = os.getenv('TRANSCRIPT_SINK', 'jsonl')
+    if backend == 'off':
+        return None
+    if backend == 'jsonl':
+        sink = JSONLSink(
+            os.getenv('TRANSCRIPT_DIR', '/tmp/chatbot_transcripts'),
+            max_bytes=int(os.getenv('TRANSCRIPT_MAX_BYTES', str(64 * 1024 ** 2))),
+            max_age=int(os.getenv('TRANSCRIPT_MAX_AGE', '3600')),
+            retention_days=int(os.getenv('TRANSCRIPT_RETENTION_DAYS', '30')),
+        )
+    elif backend == 'db':
+        sink = DatabaseSink()
+    else:
+        raise ValueError(f"TRANSCRIPT_SINK desconhecido: {backend}")
+    return TranscriptLog(
+        sink,
+        batch_size=int(os.getenv('TRANSCRIPT_BATCH_SIZE', '500')),
+        flush_interval=float(os.getenv('TRANSCRIPT_FLUSH_INTERVAL', '2')),
+        max_pending=int(os.getenv('TRANSCRIPT_MAX_PENDING', '50000')),
+        policy=os.getenv('TRANSCRIPT_BACKPRESSURE', 'drop'),
+    )
+
+
+transcripts = create_transcript_log()
+
+
+def record(telefone, numero_twilio, direcao, mensagem, estado_anterior=None, estado_novo=None, criado_em=None):
+    if transcripts is not None:
+        transcripts.record(telefone, numero_twilio, direcao, mensagem, estado_anterior, estado_novo, criado_em)
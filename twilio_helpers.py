@@ -1,14 +1,54 @@
 # Suponha que isto esteja em twilio_helpers.py ou no final de app.py
+import atexit
 import threading
-from twilio.rest import Client
+import time
 import os
 from dotenv import load_dotenv
-from time import sleep
+from dispatcher import MessageDispatcher
+from message_packing import pack_messages
+from instrumentation import TWILIO_SEND_DURATION, log_event
+from tenants import registry as tenants
+from twilio_transport import AsyncBridge, HTTPTransport, pooled_http_client, transport_options
+import transcript
 
 load_dotenv() # Inicialização do cliente Twilio
 account_sid = os.getenv('TWILIO_ACCOUNT_SID')
 auth_token = os.getenv('TWILIO_AUTH_TOKEN')
-client = Client(account_sid, auth_token)
+# sdk (twilio.rest.Client), http (POST direto, sem carregar o SDK) ou async (aiohttp); ver twilio_transport.py
+TWILIO_TRANSPORT = os.getenv('TWILIO_TRANSPORT', 'sdk')
+client = None  # Criado no primeiro envio; importar twilio.rest custa caro no boot de cada worker
+_tenant_clients = {}  # account_sid -> cliente, para tenants com conta Twilio própria
+_client_lock = threading.Lock()
+
+def create_client(sid, token):
+    # Conexões keep-alive num pool do tamanho do dispatcher, compartilhado por todos os workers
+    if TWILIO_TRANSPORT == 'http':
+        return HTTPTransport(sid, token, **transport_options())
+    if TWILIO_TRANSPORT == 'async':
+        return AsyncBridge(sid, token, **transport_options())
+    if TWILIO_TRANSPORT == 'sdk':
+        from twilio.rest import Client
+        return Client(sid, token, http_client=pooled_http_client())
+    raise ValueError(f"TWILIO_TRANSPORT desconhecido: {TWILIO_TRANSPORT}")
+
+def get_client(my_twilio_number=None):
+    # Cada número envia pela conta Twilio do tenant dono dele; sem conta própria, usa a padrão
+    global client
+    tenant = tenants.for_number(my_twilio_number) if my_twilio_number else None
+    if tenant is not None and tenant.twilio_account_sid:
+        tenant_client = _tenant_clients.get(tenant.twilio_account_sid)
+        if tenant_client is None:
+            with _client_lock:
+                tenant_client = _tenant_clients.get(tenant.twilio_account_sid)
+                if tenant_client is None:
+                    tenant_client = create_client(tenant.twilio_account_sid, tenant.twilio_auth_token)
+                    _tenant_clients[tenant.twilio_account_sid] = tenant_client
+        return tenant_client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                client = create_client(account_sid, auth_token)
+    return client
 
 def flatten_messages(messages):
     flat_list = []
@@ -19,20 +59,52 @@ def flatten_messages(messages):
             flat_list.append(item)
     return flat_list
 
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def send_message(to_number, body, my_twilio_number):
+    start = time.perf_counter()
+    status = 'error'
+    try:
+        get_client(my_twilio_number).messages.create(
+            body=body,
+            from_=my_twilio_number,
+            to=to_number
+        )
+        status = 'ok'
+    finally:
+        elapsed = time.perf_counter() - start
+        TWILIO_SEND_DURATION.observe(elapsed, status)
+        log_event('message_sent', to=to_number, status=status, duration_ms=round(elapsed * 1000, 2), length=len(body))
+
+def get_dispatcher():
+    # Criado sob demanda para que os workers não sejam iniciados antes do fork do gunicorn
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = MessageDispatcher(
+                send_message,
+                workers=int(os.getenv('DISPATCHER_WORKERS', '8')),
+                rate=float(os.getenv('TWILIO_MESSAGES_PER_SECOND', '1')),  # Vazão por número Twilio
+                burst=int(os.getenv('TWILIO_MESSAGES_BURST', '1')),
+                max_queue_size=int(os.getenv('DISPATCHER_MAX_QUEUE', '10000')),
+                max_retries=int(os.getenv('DISPATCHER_MAX_RETRIES', '3')),
+            )
+            _dispatcher.start()
+            atexit.register(_dispatcher.shutdown, float(os.getenv('DISPATCHER_DRAIN_TIMEOUT', '30')))
+        return _dispatcher
+
 def send_auto_messages(to_number, messages, my_twilio_number):
-    def run():
-        flat_messages = flatten_messages(messages)  # Achata a lista de mensagens
+    flat_messages = []
+    for message in flatten_messages(messages):  # Achata a lista de mensagens
+        if isinstance(message, str) and message.strip():  # Verifica se a mensagem é uma string não vazia
+            flat_messages.append(message)
+        else:
+            log_event('message_skipped', to=to_number, message=repr(message))
+    if os.getenv('MESSAGE_PACKING', '1') == '1':
+        # Junta os fragmentos da resposta para economizar chamadas à API e segmentos
+        flat_messages = pack_messages(flat_messages, whatsapp=to_number.startswith('whatsapp:'))
+    if flat_messages:
+        get_dispatcher().submit(to_number, flat_messages, my_twilio_number)
         for message in flat_messages:
-            if isinstance(message, str) and message.strip():  # Verifica se a mensagem é uma string não vazia
-                print(f"Sending message to {to_number}: {message}")
-                client.messages.create(
-                    body=message,
-                    from_=my_twilio_number,
-                    to=to_number
-                )
-                sleep(1)  # Adiciona uma pequena pausa entre as mensagens
-            else:
-                print(f"Skipped sending a message due to it being None or empty: {message}")
-
-    thread = threading.Thread(target=run)
-    thread.start()
+            transcript.record(to_number, my_twilio_number, 'out', message)
@@ -0,0 +1,104 @@
+# twilio_standin.py
+# Servidor local compatível com POST /2010-04-01/Accounts/<sid>/Messages.json, para testes e benchmarks
+# de envio sem falar com a Twilio de verdade:
+#
+#   python twilio_standin.py --port 8099 --latency-ms 80 --error-rate 0.01
+#   TWILIO_API_URL=http://127.0.0.1:8099 python app.py
+#
+# GET /stats mostra quantas mensagens chegaram; GET /messages?to=... lista as últimas recebidas.
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from aiohttp import web
+
+
+class StandIn:
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, throttle_rate=0.0, keep=10000, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate  # Fração respondida com 500
+        self.throttle_rate = throttle_rate  # Fração respondida com 429
+        self.messages = deque(maxlen=keep)
+        self.counts = {'accepted': 0, 'failed': 0, 'throttled': 0, 'invalid': 0}
+        self.started_at = time.monotonic()
+        self._ids = itertools.count(1)
+        self._rng = random.Random(seed)
+
+    async def create_message(self, request):
+        if self.latency_ms or self.jitter_ms:
+            await asyncio.sleep((self.latency_ms + self._rng.uniform(0, self.jitter_ms)) / 1000)
+        form = await request.post()
+        if not form.get('To') or not form.get('From') or not form.get('Body'):
+            self.counts['invalid'] += 1
+            return _error(400, 21604, "A 'To', 'From' and 'Body' parameter is required to send a message.")
+        roll = self._rng.random()
+        if roll < self.throttle_rate:
+            self.counts['throttled'] += 1
+            return _error(429, 20429, 'Too Many Requests')
+        if roll < self.throttle_rate + self.error_rate:
+            self.counts['failed'] += 1
+            return _error(500, 20500, 'Internal Server Error')
+        message = {
+            'sid': f'SM{next(self._ids):032x}',
+            'account_sid': request.match_info['account_sid'],
+            'to': form['To'],
+            'from': form['From'],
+            'body': form['Body'],
+            'status': 'queued',
+            'num_segments': str(max(1, -(-len(form['Body']) // 153))),
+            'date_created': datetime.now(timezone.utc).strftime('%a, %d %b %Y %H:%M:%S +0000'),
+            'api_version': '2010-04-01',
+        }
+        self.messages.append(message)
+        self.counts['accepted'] += 1
+        return web.json_response(message, status=201)
+
+    async def stats(self, request):
+        elapsed = time.monotonic() - self.started_at
+        return web.json_response(dict(self.counts, elapsed_s=round(elapsed, 2)))
+
+    async def list_messages(self, request):
+        to_number = request.query.get('to')
+        messages = [m for m in self.messages if to_number is None or m['to'] == to_number]
+        return web.json_response({'messages': messages[-int(request.query.get('limit', '100')):]})
+
+    async def reset(self, request):
+        self.messages.clear()
+        self.counts = dict.fromkeys(self.counts, 0)
+        self.started_at = time.monotonic()
+        return web.json_response({'ok': True})
+
+
+def _error(status, code, message):
+    return web.json_response({'code': code, 'message': message, 'status': status}, status=status)
+
+
+def create_app(standin):
+    app = web.Application()
+    app.router.add_post('/2010-04-01/Accounts/{account_sid}/Messages.json', standin.create_message)
+    app.router.add_get('/stats', standin.stats)
+    app.router.add_get('/messages', standin.list_messages)
+    app.router.add_post('/reset', standin.reset)
+    return app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency-ms', type=float, default=0, help='atraso fixo por requisição')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='atraso extra aleatório, entre 0 e este valor')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fração respondida com 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fração respondida com 429')
+    parser.add_argument('--seed', type=int)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    standin = StandIn(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate, seed=args.seed)
+    web.run_app(create_app(standin), host=args.host, port=args.port, access_log=None)
@@ -0,0 +1,219 @@
+# twilio_transport.py
+# Transportes HTTP para a API de mensagens da Twilio. Todos mantêm conexões keep-alive num pool do
+# tamanho da concorrência de envio, em vez de um handshake TLS por mensagem.
+#
+#   sdk   - twilio.rest.Client com PooledTwilioHttpClient (padrão, TWILIO_TRANSPORT=sdk)
+#   http  - POST direto em /Messages.json com uma requests.Session (TWILIO_TRANSPORT=http)
+#   async - AsyncTransport (aiohttp) num event loop próprio; os workers do dispatcher entregam cada envio
+#           a ele pelo AsyncBridge (TWILIO_TRANSPORT=async). send_batch serve quem já roda num event loop.
+#
+# TWILIO_API_URL troca https://api.twilio.com por outro endereço, ex.: o twilio_standin.py local.
+import asyncio
+import atexit
+import json
+import os
+import threading
+from collections import defaultdict
+
+TWILIO_API_URL = 'https://api.twilio.com'
+
+
+class TwilioAPIError(Exception):
+    # Mesmo atributo status do TwilioRestException, usado pelo dispatcher para decidir se tenta de novo
+    def __init__(self, status, message, code=None):
+        super().__init__(f'HTTP {status}: {message}')
+        self.status = status
+        self.code = code
+
+
+def api_url():
+    return os.getenv('TWILIO_API_URL', TWILIO_API_URL).rstrip('/')
+
+
+def messages_path(account_sid):
+    return f'/2010-04-01/Accounts/{account_sid}/Messages.json'
+
+
+def transport_options(pool_size=None):
+    # Timeouts e retentativas de conexão; erros HTTP (429/5xx) ficam com o backoff do dispatcher
+    return {
+        'pool_size': pool_size or int(os.getenv('TWILIO_HTTP_POOL_SIZE', os.getenv('DISPATCHER_WORKERS', '8'))),
+        'connect_timeout': float(os.getenv('TWILIO_HTTP_CONNECT_TIMEOUT', '3')),
+        'read_timeout': float(os.getenv('TWILIO_HTTP_READ_TIMEOUT', '10')),
+        'max_retries': int(os.getenv('TWILIO_HTTP_RETRIES', '2')),
+    }
+
+
+def _mount_pool(session, pool_size, connect_timeout, max_retries):
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    class PooledAdapter(HTTPAdapter):
+        # O SDK só aceita um timeout único (de leitura); o de conexão é aplicado aqui
+        def send(self, request, timeout=None, **kwargs):
+            if not isinstance(timeout, tuple):
+                timeout = (connect_timeout, timeout)
+            return super().send(request, timeout=timeout, **kwargs)
+
+    # Só repete falhas de conexão: um POST que chegou à Twilio pode ter gerado uma mensagem
+    retry = Retry(total=max_retries, connect=max_retries, read=0, status=0, other=0,
+                  backoff_factor=0.2, allowed_methods=None)
+    adapter = PooledAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+
+def pooled_http_client(pool_size=None):
+    # http_client para o twilio.rest.Client; importa o SDK só quando o primeiro cliente é criado
+    from twilio.http.http_client import TwilioHttpClient
+
+    class PooledTwilioHttpClient(TwilioHttpClient):
+        def __init__(self, pool_size, connect_timeout, read_timeout, max_retries):
+            super().__init__(pool_connections=True, timeout=read_timeout)
+            self.base_url = api_url()
+            _mount_pool(self.session, pool_size, connect_timeout, max_retries)
+
+        def request(self, method, url, params=None, data=None, headers=None, auth=None, timeout=None,
+                    allow_redirects=False):
+            if self.base_url != TWILIO_API_URL and url.startswith(TWILIO_API_URL):
+                url = self.base_url + url[len(TWILIO_API_URL):]
+            return super().request(method, url, params=params, data=data, headers=headers, auth=auth,
+                                   timeout=timeout, allow_redirects=allow_redirects)
+
+    return PooledTwilioHttpClient(**transport_options(pool_size))
+
+
+class HTTPTransport:
+    # Envio síncrono sem o SDK: um POST por mensagem numa sessão keep-alive compartilhada pelos workers
+    def __init__(self, account_sid, auth_token, pool_size=8, connect_timeout=3, read_timeout=10, max_retries=2):
+        import requests
+        self.url = api_url() + messages_path(account_sid)
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.auth = (account_sid, auth_token)
+        _mount_pool(self.session, pool_size, connect_timeout, max_retries)
+        self.messages = self  # Mesma interface do client.messages.create do SDK
+
+    def create(self, body, from_, to):
+        return self.send(to, body, from_)
+
+    def send(self, to_number, body, from_number):
+        response = self.session.post(self.url, data={'To': to_number, 'From': from_number, 'Body': body},
+                                     timeout=self.timeout)
+        if response.status_code >= 400:
+            raise _api_error(response.status_code, response.text)
+        return response.json().get('sid')
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncTransport:
+    # Envio com asyncio: no máximo `concurrency` requisições em andamento, num único pool de conexões.
+    # Precisa ser usado dentro do event loop que o criou (a sessão do aiohttp é aberta no primeiro envio).
+    def __init__(self, account_sid, auth_token, concurrency=8, connect_timeout=3, read_timeout=10, max_retries=2):
+        self.url = api_url() + messages_path(account_sid)
+        self.auth = (account_sid, auth_token)
+        self.concurrency = concurrency
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None:
+            import aiohttp
+            self._session = aiohttp.ClientSession(
+                auth=aiohttp.BasicAuth(*self.auth),
+                connector=aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=30),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout),
+            )
+        return self._session
+
+    async def send(self, to_number, body, from_number):
+        import aiohttp
+        data = {'To': to_number, 'From': from_number, 'Body': body}
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with self._get_session().post(self.url, data=data) as response:
+                        if response.status >= 400:
+                            raise _api_error(response.status, await response.text())
+                        return (await response.json()).get('sid')
+                except aiohttp.ClientConnectionError:
+                    # Mesma regra do transporte síncrono: só falhas de conexão são repetidas aqui
+                    if attempt == self.max_retries:
+                        raise
+                    await asyncio.sleep(0.2 * 2 ** attempt)
+
+    async def send_batch(self, messages):
+        # messages: [(para, texto, de)]. Destinatários diferentes seguem em paralelo; as mensagens
+        # de um mesmo destinatário saem em ordem. Retorna o sid ou a exceção de cada mensagem.
+        results = [None] * len(messages)
+        by_recipient = defaultdict(list)
+        for i, (to_number, body, from_number) in enumerate(messages):
+            by_recipient[to_number].append(i)
+
+        async def deliver(indexes):
+            for i in indexes:
+                try:
+                    results[i] = await self.send(*messages[i])
+                except Exception as e:
+                    results[i] = e
+
+        await asyncio.gather(*(deliver(indexes) for indexes in by_recipient.values()))
+        return results
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class AsyncBridge:
+    # Mesma interface do client.messages.create do SDK, para o dispatcher. Cada envio vira uma corrotina
+    # no event loop de uma thread própria, onde um único AsyncTransport mantém o pool de conexões;
+    # o worker do dispatcher só espera o resultado.
+    def __init__(self, account_sid, auth_token, pool_size=8, **options):
+        self._transport_args = (account_sid, auth_token)
+        self._transport_options = dict(options, concurrency=pool_size)
+        self._transport = None
+        self._loop = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.messages = self
+
+    def _start(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Criado sob demanda para não iniciar a thread antes do fork do gunicorn
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='twilio-async', daemon=True).start()
+                self._transport = AsyncTransport(*self._transport_args, **self._transport_options)
+                self._loop = loop
+                self._pid = os.getpid()
+                atexit.register(self.close)
+        return self._loop
+
+    def create(self, body, from_, to):
+        return self.send(to, body, from_)
+
+    def send(self, to_number, body, from_number):
+        loop = self._start()
+        return asyncio.run_coroutine_threadsafe(self._transport.send(to_number, body, from_number), loop).result()
+
+    def close(self):
+        if self._loop is None or self._pid != os.getpid():
+            return
+        asyncio.run_coroutine_threadsafe(self._transport.close(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def _api_error(status, text):
+    # Corpo de erro da Twilio: {"code": 21211, "message": "...", "status": 400}
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        return TwilioAPIError(status, text[:200])
+    return TwilioAPIError(status, payload.get('message', text[:200]), payload.get('code'))
@@ -0,0 +1,98 @@
+# worker_pool.py
+import logging
+import queue
+import threading
+from collections import deque
+
+logger = logging.getLogger('chatbot.worker_pool')
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class KeyedWorkerPool:
+    # Número fixo de workers; itens com a mesma chave são processados em ordem, um de cada vez
+    def __init__(self, handler, workers=8, max_queue_size=10000, name='worker'):
+        self.handler = handler
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.name = name
+
+        self._pending = {}  # chave -> fila FIFO de itens
+        self._ready = queue.Queue()  # chaves com itens e sem worker atendendo
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._depth = 0
+        self._in_flight = 0
+        self._closed = False
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'{self.name}-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, items):
+        with self._lock:
+            if self._closed:
+                raise QueueFullError(f"{self.name} encerrado")
+            if self._depth + len(items) > self.max_queue_size:
+                raise QueueFullError(f"Fila {self.name} cheia ({self._depth} itens)")
+            key_queue = self._pending.get(key)
+            is_new = key_queue is None
+            if is_new:
+                key_queue = self._pending[key] = deque()
+            key_queue.extend(items)
+            self._depth += len(items)
+        if is_new:
+            self._ready.put(key)
+
+    def _worker(self):
+        while True:
+            key = self._ready.get()
+            if key is None:
+                return
+            with self._lock:
+                item = self._pending[key].popleft()
+                self._in_flight += 1
+
+            try:
+                self.handler(key, item)
+            except Exception:
+                logger.exception(f"{self.name} failed to process item", extra={'fields': {'key': key}})
+
+            with self._lock:
+                self._depth -= 1
+                self._in_flight -= 1
+                if self._pending[key]:
+                    # Volta para o fim da fila para não monopolizar um worker
+                    self._ready.put(key)
+                else:
+                    del self._pending[key]
+                if not self._depth:
+                    self._idle.notify_all()
+
+    def drain(self, timeout=None):
+        # Espera todos os itens enfileirados serem processados
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._depth, timeout)
+
+    def shutdown(self, timeout=None):
+        with self._lock:
+            self._closed = True
+        drained = self.drain(timeout)
+        for _ in self._threads:
+            self._ready.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        return drained
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self._depth,
+                'queued_keys': len(self._pending),
+                'in_flight': self._in_flight,
+            }